@@ -0,0 +1,44 @@
+"""
+Mide el arranque en frío de un worker: tiempo de `import sgos_web.app`
+en un proceso nuevo (lo que paga cada worker de gunicorn y manage_users.py).
+
+Uso:
+    python benchmarks/arranque.py [repeticiones]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CODIGO = """
+import sys, time
+t0 = time.perf_counter()
+import sgos_web.app
+t1 = time.perf_counter()
+print(f"{t1 - t0:.4f} {int('pandas' in sys.modules)}")
+"""
+
+
+def medir(repeticiones: int = 5):
+    tiempos = []
+    pandas_cargado = False
+    for _ in range(repeticiones):
+        out = subprocess.run(
+            [sys.executable, "-c", CODIGO],
+            cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        seg, pd_flag = out.split()
+        tiempos.append(float(seg))
+        pandas_cargado = pandas_cargado or pd_flag == "1"
+    return tiempos, pandas_cargado
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    tiempos, pandas_cargado = medir(n)
+    print(f"import sgos_web.app ({n} procesos nuevos)")
+    print(f"  mediana: {statistics.median(tiempos) * 1000:.0f} ms")
+    print(f"  min/max: {min(tiempos) * 1000:.0f} / {max(tiempos) * 1000:.0f} ms")
+    print(f"  pandas importado al arrancar: {'sí' if pandas_cargado else 'no'}")
@@ -0,0 +1,208 @@
+"""
+Mide cómo afectan las ingestas a los dashboards cuando ocurren a la vez:
+levanta la app contra una base SQLite nueva, y mientras un cliente sube
+archivos Getnet uno tras otro (subida por partes), varios clientes piden
+dashboards y APIs del histórico. Reporta la latencia de las lecturas y los
+errores (p.ej. "database is locked").
+
+Por defecto compara el journal de SQLite por defecto (DELETE) con WAL, vía
+SGOS_SQLITE_JOURNAL. Usa gunicorn si está instalado; si no, `flask run`
+con hilos.
+
+Uso:
+    python benchmarks/concurrencia.py [--lectores 8] [--subidas 4] [--filas 20000] [--journal DELETE WAL]
+"""
+import argparse
+import datetime as dt
+import hashlib
+import http.cookiejar
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LECTURAS = ["/dashboard_db", "/api/graficos?tipo=getnet&granularidad=diaria", "/api/ranking_asistentes?n=5", "/graphs"]
+ASISTENTES = ["ANA", "BETO", "CARLA", "DIEGO", "ELSA", "FELIPE", "GLORIA", "HUGO"]
+
+
+def generar_getnet(path: str, filas: int, mes: int, semilla: int):
+    """Excel Getnet sintético de un mes (cada archivo es un mes distinto, así todos escriben)."""
+    import pandas as pd
+
+    rnd = random.Random(semilla)
+    horas = list(range(10, 24)) + list(range(0, 9))
+    registros = []
+    for i in range(filas):
+        f = dt.datetime(2024, mes, rnd.randint(1, 28), rnd.choice(horas), rnd.randint(0, 59), rnd.randint(0, 59))
+        jornada = (f - dt.timedelta(hours=10)).replace(hour=0, minute=0, second=0)
+        registros.append({
+            "Fecha": f.strftime("%d-%m-%Y %H:%M:%S"), "Jornada": jornada.strftime("%d-%m-%Y"),
+            "Id Cliente": str(rnd.randint(1, 500)), "Monto": rnd.randint(1, 50) * 1000, "Voucher": i,
+            "Slot Attendant": rnd.choice(ASISTENTES), "Validador": "V", "Forma Pago": "Tarjeta", "Ingreso CAWA": "SI",
+        })
+    pd.DataFrame(registros).to_excel(path, index=False)
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _cliente(base: str):
+    """Opener con cookies y sesión iniciada como admin."""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    datos = "username=admin&password=admin123".encode()
+    opener.open(urllib.request.Request(base + "/login", data=datos), timeout=60).read()
+    return opener
+
+
+def _json(opener, url: str, metodo: str = "GET", cuerpo=None, tipo="application/json"):
+    if isinstance(cuerpo, dict):
+        cuerpo = json.dumps(cuerpo).encode()
+    req = urllib.request.Request(url, data=cuerpo, method=metodo, headers={"Content-Type": tipo})
+    with opener.open(req, timeout=300) as resp:
+        return json.loads(resp.read() or b"{}")
+
+
+def subir(opener, base: str, path: str, bloque: int = 4 * 1024 * 1024):
+    """Subida por partes completa (ver subidas.py) y espera a que termine la ingesta."""
+    datos = open(path, "rb").read()
+    estado = _json(opener, base + "/upload/iniciar", "POST", {
+        "nombre": os.path.basename(path), "tamano": len(datos), "sha256": hashlib.sha256(datos).hexdigest(),
+    })
+    url = f"{base}/upload/{estado['id']}"
+    offset = 0
+    while offset < len(datos):
+        offset = _json(opener, f"{url}?offset={offset}", "PUT", datos[offset:offset + bloque], "application/octet-stream")["recibido"]
+    _json(opener, url + "/completar", "POST", {})
+    while True:
+        estado = _json(opener, url)
+        if estado["etapa"] != "procesando":
+            return estado
+        time.sleep(0.2)
+
+
+def _levantar_servidor(trabajo: str, puerto: int, env: dict):
+    if importlib.util.find_spec("gunicorn"):
+        cmd = [sys.executable, "-m", "gunicorn", "-w", "4", "--threads", "4", "-b", f"127.0.0.1:{puerto}", "sgos_web.app:app"]
+    else:
+        cmd = [sys.executable, "-m", "flask", "--app", "sgos_web.app", "run", "--with-threads", "-p", str(puerto)]
+    proc = subprocess.Popen(cmd, cwd=trabajo, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{puerto}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + "/login", timeout=1).read()
+            return proc, base, cmd[2]
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def correr(journal: str, archivos: list, lectores: int) -> dict:
+    trabajo = tempfile.mkdtemp(prefix="sgos_bench_")
+    env = {
+        **os.environ,
+        "PYTHONPATH": RAIZ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(trabajo, 'bench.db')}",
+        "SGOS_SQLITE_JOURNAL": journal,
+        "SGOS_BARRIDO_SEGUNDOS": "0",
+    }
+    subprocess.run([sys.executable, "-m", "flask", "--app", "sgos_web.app", "init-db"],
+                   cwd=trabajo, env=env, check=True, capture_output=True)
+    proc, base, servidor = _levantar_servidor(trabajo, _puerto_libre(), env)
+    try:
+        # Un mes ya cargado para que los dashboards tengan algo que mostrar
+        subir(_cliente(base), base, archivos[0])
+
+        latencias, errores = [], []
+        fin = threading.Event()
+        lock = threading.Lock()
+
+        def lector(n):
+            opener = _cliente(base)
+            i = n
+            while not fin.is_set():
+                ruta = LECTURAS[i % len(LECTURAS)]
+                i += 1
+                t0 = time.perf_counter()
+                try:
+                    opener.open(base + ruta, timeout=120).read()
+                    with lock:
+                        latencias.append(time.perf_counter() - t0)
+                except Exception as e:
+                    with lock:
+                        errores.append(f"{ruta}: {e}")
+
+        hilos = [threading.Thread(target=lector, args=(n,)) for n in range(lectores)]
+        for h in hilos:
+            h.start()
+
+        duraciones = []
+        opener = _cliente(base)
+        for path in archivos[1:]:
+            t0 = time.perf_counter()
+            estado = subir(opener, base, path)
+            duraciones.append(time.perf_counter() - t0)
+            if estado["etapa"] != "listo" or "Error" in (estado["mensaje"] or ""):
+                errores.append(f"subida {os.path.basename(path)}: {estado['mensaje']}")
+
+        fin.set()
+        for h in hilos:
+            h.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    latencias.sort()
+    return {
+        "servidor": servidor,
+        "lecturas": len(latencias),
+        "p50": statistics.median(latencias) if latencias else None,
+        "p95": latencias[int(len(latencias) * 0.95)] if latencias else None,
+        "max": latencias[-1] if latencias else None,
+        "subida_media": statistics.mean(duraciones) if duraciones else None,
+        "errores": errores,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lectores", type=int, default=8)
+    parser.add_argument("--subidas", type=int, default=4, help="archivos a subir con los lectores activos")
+    parser.add_argument("--filas", type=int, default=20000, help="filas por archivo")
+    parser.add_argument("--journal", nargs="+", default=["DELETE", "WAL"])
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp(prefix="sgos_bench_xlsx_")
+    archivos = []
+    for mes in range(1, args.subidas + 2):
+        path = os.path.join(carpeta, f"getnet_{mes:02d}.xlsx")
+        generar_getnet(path, args.filas, mes, semilla=mes)
+        archivos.append(path)
+
+    try:
+        for journal in args.journal:
+            r = correr(journal, archivos, args.lectores)
+            ms = lambda s: f"{s * 1000:.0f} ms" if s is not None else "-"
+            print(f"journal={journal} ({r['servidor']}, {args.lectores} lectores, {args.subidas} subidas de {args.filas} filas)")
+            print(f"  lecturas: {r['lecturas']}  p50 {ms(r['p50'])}  p95 {ms(r['p95'])}  máx {ms(r['max'])}")
+            print(f"  subida + ingesta media: {ms(r['subida_media'])}")
+            print(f"  errores: {len(r['errores'])}")
+            for e in r["errores"][:5]:
+                print(f"    {e}")
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
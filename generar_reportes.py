@@ -0,0 +1,166 @@
+"""
+Genera los reportes en Excel por línea de comandos, sin pasar por la web.
+Pensado para correr de noche (cron / tarea programada) y dejar listos los
+packs mensuales.
+
+Fuentes:
+  - Uno o varios Excel (Getnet o Premios), igual que al subirlos.
+  - La base de datos (--db): históricos Getnet y Premios.
+
+Cada fuente produce un Excel con todo el rango y, con --mensual, uno por mes.
+Los reportes se calculan en paralelo en varios procesos.
+
+Ejemplos:
+    python generar_reportes.py enero.xlsx febrero.xlsx --salida reportes/
+    python generar_reportes.py --db --mensual --desde 2024-01 --hasta 2024-12 --salida packs/ --procesos 4
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Aseguramos que Python encuentre el módulo sgos_web
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from sgos_web import engine
+
+
+def _mes(valor: str) -> str:
+    """Valida YYYY-MM (el formato de la columna Mes)."""
+    try:
+        datetime.datetime.strptime(valor, "%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{valor}' no es un mes YYYY-MM")
+    return valor
+
+
+def _filtrar_rango(df, desde: str | None, hasta: str | None):
+    if desde:
+        df = df[df["Mes"] >= desde]
+    if hasta:
+        df = df[df["Mes"] <= hasta]
+    return df
+
+
+def _escribir(df, ruta: str) -> tuple[str, int]:
+    tablas = engine.generar_reportes(df)
+    with open(ruta, "wb") as f:
+        f.write(engine.exportar_excel_bytes(tablas).getbuffer())
+    return ruta, len(df)
+
+
+def _rutas(meses: list, prefijo: str, salida: str, mensual: bool) -> list:
+    """
+    [(mes, ruta)] de los Excel a escribir: mes None es el de todo el rango y,
+    si `mensual`, uno por cada mes.
+    """
+    if not meses:
+        return []
+    rango = meses[0] if len(meses) == 1 else f"{meses[0]}_a_{meses[-1]}"
+    rutas = [(None, os.path.join(salida, f"{prefijo}_{rango}.xlsx"))]
+    if mensual and len(meses) > 1:
+        rutas += [(mes, os.path.join(salida, f"{prefijo}_{mes}.xlsx")) for mes in meses]
+    return rutas
+
+
+def reportes_de_archivo(path: str, salida: str, desde: str | None, hasta: str | None, mensual: bool) -> list:
+    """Corre en un proceso del pool: carga el Excel y escribe sus reportes."""
+    df = _filtrar_rango(engine.cargar_archivo(path), desde, hasta)
+    prefijo = os.path.splitext(os.path.basename(path))[0]
+    meses = sorted(df["Mes"].dropna().unique())
+    return [
+        _escribir(df if mes is None else df[df["Mes"] == mes], ruta)
+        for mes, ruta in _rutas(meses, prefijo, salida, mensual)
+    ]
+
+
+def _meses_db(desde: str | None, hasta: str | None) -> dict:
+    """
+    {tipo: meses con datos en el rango} de los históricos de la BD. De paso
+    deja creado el snapshot de cada tabla, para que los procesos del pool lo
+    mapeen en vez de leer la BD cada uno.
+    """
+    from sgos_web.app import MODELOS_POR_TIPO, _tabla_arrow, app, db
+    from sqlalchemy import select
+
+    meses = {}
+    with app.app_context():
+        for tipo, Model in MODELOS_POR_TIPO.items():
+            _tabla_arrow(tipo)
+            todos = db.session.execute(select(Model.mes).where(Model.mes.isnot(None)).distinct()).scalars()
+            meses[tipo] = sorted(m for m in todos if (not desde or m >= desde) and (not hasta or m <= hasta))
+    return meses
+
+
+def reportes_de_db(tipo: str, desde: str | None, hasta: str | None, ruta: str) -> tuple[str, int]:
+    """
+    Corre en un proceso del pool: lee de la BD (vía el snapshot) solo los meses
+    de `desde` a `hasta` y escribe su reporte. Al proceso no viaja ningún DataFrame.
+    """
+    from sgos_web.app import app, get_db_dataframe, get_premios_dataframe
+
+    leer = get_premios_dataframe if tipo == "PREMIOS" else get_db_dataframe
+    with app.app_context():
+        df = leer(desde, hasta)
+    return _escribir(df, ruta)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Genera los reportes SGOS en Excel desde archivos o desde la base de datos.",
+    )
+    parser.add_argument("archivos", nargs="*", help="Excel de Getnet o Premios")
+    parser.add_argument("--db", action="store_true", help="usar los históricos de la base de datos")
+    parser.add_argument("--desde", type=_mes, help="primer mes a incluir (YYYY-MM)")
+    parser.add_argument("--hasta", type=_mes, help="último mes a incluir (YYYY-MM)")
+    parser.add_argument("--mensual", action="store_true", help="además, un Excel por cada mes")
+    parser.add_argument("--salida", default="reportes", help="carpeta de salida (por defecto: reportes/)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="procesos en paralelo")
+    args = parser.parse_args(argv)
+
+    if not args.archivos and not args.db:
+        parser.error("indica uno o más archivos o --db")
+    if args.desde and args.hasta and args.desde > args.hasta:
+        parser.error("--desde es posterior a --hasta")
+    for path in args.archivos:
+        if not os.path.isfile(path):
+            parser.error(f"no existe el archivo {path}")
+    os.makedirs(args.salida, exist_ok=True)
+
+    t0 = time.perf_counter()
+    errores = 0
+    # spawn: los procesos no heredan hilos ni conexiones del proceso principal
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, args.procesos), mp_context=contexto) as pool:
+        futuros = {
+            pool.submit(reportes_de_archivo, path, args.salida, args.desde, args.hasta, args.mensual): path
+            for path in args.archivos
+        }
+        if args.db:
+            for tipo, meses in _meses_db(args.desde, args.hasta).items():
+                if not meses:
+                    print(f"- {tipo.lower()}: sin datos en el rango")
+                for mes, ruta in _rutas(meses, tipo.lower(), args.salida, args.mensual):
+                    rango = (args.desde, args.hasta) if mes is None else (mes, mes)
+                    futuros[pool.submit(reportes_de_db, tipo, *rango, ruta)] = f"{tipo.lower()} ({os.path.basename(ruta)})"
+
+        for futuro in as_completed(futuros):
+            origen = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                errores += 1
+                print(f"❌ {origen}: {e}")
+                continue
+            for ruta, filas in resultado if isinstance(resultado, list) else [resultado]:
+                print(f"✅ {ruta} ({filas} filas)")
+
+    print(f"Listo en {time.perf_counter() - t0:.1f} s" + (f", {errores} con error" if errores else ""))
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Mantenimiento de la carpeta de uploads: compactación, expiración y cuota.
+
+Un barrido:
+1. Compacta los Excel ya ingeridos: los reemplaza por una copia columnar
+   comprimida (<archivo>.parquet) del DataFrame ya limpio, que además se lee
+   mucho más rápido que volver a parsear el Excel.
+2. Borra lo que no se usa hace más de `max_dias` (el uso se marca con tocar()).
+3. Si la carpeta sigue sobre la cuota, borra por LRU hasta quedar debajo.
+
+Nunca toca los archivos `protegidos` (p.ej. el snapshot vigente) ni los que se
+están escribiendo (*.tmp, y *.part / *.subida de las subidas por partes), salvo
+que lleven más de `vencimiento_en_curso` segundos sin cambios: esos quedaron
+abandonados. Con varios workers, un archivo de lock evita que dos procesos
+barran al mismo tiempo.
+"""
+import os
+import threading
+import time
+
+SUFIJO_COMPACTO = ".parquet"
+EXTENSIONES_EN_CURSO = (".tmp", ".part", ".subida")
+ARCHIVO_LOCK = ".barrido.lock"
+
+
+def tocar(path: str) -> None:
+    """Marca el archivo como usado ahora (la mtime es la referencia del LRU)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def ruta_datos(path: str) -> str | None:
+    """Ruta real de un upload: el Excel original o su copia compactada."""
+    if os.path.exists(path):
+        return path
+    if os.path.exists(path + SUFIJO_COMPACTO):
+        return path + SUFIJO_COMPACTO
+    return None
+
+
+def _listar(carpeta: str, en_curso: bool = False) -> list:
+    """
+    (ruta, tamaño, mtime) de todos los archivos bajo la carpeta, recursivo.
+    Con en_curso=True lista solo los que se están escribiendo.
+    """
+    archivos = []
+    for raiz, _, nombres in os.walk(carpeta):
+        for nombre in nombres:
+            if nombre == ARCHIVO_LOCK or nombre.endswith(EXTENSIONES_EN_CURSO) != en_curso:
+                continue
+            ruta = os.path.join(raiz, nombre)
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            archivos.append((ruta, st.st_size, st.st_mtime))
+    return archivos
+
+
+def _tomar_lock(carpeta: str, vencimiento: float) -> str | None:
+    ruta = os.path.join(carpeta, ARCHIVO_LOCK)
+    try:
+        if time.time() - os.stat(ruta).st_mtime > vencimiento:
+            os.remove(ruta)  # Lock de un proceso que murió a medio barrido
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return ruta
+
+
+def compactar(path: str, cargar) -> str:
+    """
+    Guarda cargar(path) (el DataFrame limpio) como parquet comprimido junto al
+    original y borra el Excel. Devuelve la ruta compactada.
+    """
+    df = cargar(path)
+    # Columnas de texto con tipos mezclados (números y strings) no entran en parquet
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) or v != v else str(v))
+
+    destino = path + SUFIJO_COMPACTO
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, compression="zstd", index=False)
+    os.replace(tmp, destino)
+    # Conserva la fecha de uso del original para no alterar el LRU
+    st = os.stat(path)
+    os.utime(destino, (st.st_atime, st.st_mtime))
+    os.remove(path)
+    return destino
+
+
+def barrer(carpeta: str, cuota_bytes: int, max_dias: float, ingeridos: set,
+           protegidos: set, cargar, vencimiento_lock: float = 3600,
+           vencimiento_en_curso: float = 86400) -> dict | None:
+    """
+    Ejecuta un barrido completo. `ingeridos` son nombres de archivo (en la
+    carpeta) ya cargados en la BD, candidatos a compactar; `protegidos` son
+    rutas absolutas que no se borran. `cargar` es la función que convierte un
+    Excel en el DataFrame limpio.
+    Devuelve un resumen, o None si otro proceso ya está barriendo.
+    """
+    lock = _tomar_lock(carpeta, vencimiento_lock)
+    if lock is None:
+        return None
+
+    resumen = {"compactados": 0, "expirados": 0, "por_cuota": 0, "abandonados": 0, "bytes_liberados": 0, "errores": 0}
+    try:
+        limite_en_curso = time.time() - vencimiento_en_curso
+        for ruta, tam, mtime in _listar(carpeta, en_curso=True):
+            if mtime < limite_en_curso and _borrar(ruta):
+                resumen["abandonados"] += 1
+                resumen["bytes_liberados"] += tam
+
+        for nombre in ingeridos:
+            ruta = os.path.join(carpeta, nombre)
+            if not os.path.exists(ruta):
+                continue
+            antes = os.path.getsize(ruta)
+            try:
+                destino = compactar(ruta, cargar)
+            except Exception:
+                resumen["errores"] += 1
+                continue
+            resumen["compactados"] += 1
+            resumen["bytes_liberados"] += antes - os.path.getsize(destino)
+
+        protegidos = {os.path.abspath(p) for p in protegidos}
+        archivos = [a for a in _listar(carpeta) if os.path.abspath(a[0]) not in protegidos]
+
+        limite = time.time() - max_dias * 86400
+        vigentes = []
+        for ruta, tam, mtime in archivos:
+            if max_dias and mtime < limite:
+                if _borrar(ruta):
+                    resumen["expirados"] += 1
+                    resumen["bytes_liberados"] += tam
+            else:
+                vigentes.append((ruta, tam, mtime))
+
+        total = sum(tam for _, tam, _ in _listar(carpeta))
+        for ruta, tam, _ in sorted(vigentes, key=lambda a: a[2]):  # Menos usado primero
+            if not cuota_bytes or total <= cuota_bytes:
+                break
+            if _borrar(ruta):
+                total -= tam
+                resumen["por_cuota"] += 1
+                resumen["bytes_liberados"] += tam
+        resumen["bytes_totales"] = total
+        return resumen
+    finally:
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+
+
+def _borrar(ruta: str) -> bool:
+    try:
+        os.remove(ruta)
+        return True
+    except OSError:
+        return False
+
+
+def iniciar_barrido_periodico(intervalo: float, tarea) -> threading.Thread | None:
+    """Lanza un hilo daemon que llama tarea() cada `intervalo` segundos (0 = desactivado)."""
+    if not intervalo:
+        return None
+
+    def _bucle():
+        while True:
+            time.sleep(intervalo)
+            try:
+                tarea()
+            except Exception as e:
+                print(f"Barrido de uploads falló: {e}")
+
+    hilo = threading.Thread(target=_bucle, name="barrido-uploads", daemon=True)
+    hilo.start()
+    return hilo
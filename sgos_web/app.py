@@ -1,40 +1,152 @@
+import hashlib
 import os
+import re
+import sqlite3
+import threading
 import uuid
 from io import BytesIO
-import pandas as pd
+import click
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, session, abort
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, send_file, flash, session, abort, make_response, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import select
+from sqlalchemy import cast, event, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 
-load_dotenv()  # Carga las variables del archivo .env
-
 try:
-    from sgos_web.engine import procesar_sgos, exportar_excel_bytes, obtener_asistentes, guardar_datos_db, generar_reportes
+    from sgos_web import almacen, cache, snapshot, subidas
+    from sgos_web.cache import CacheVersionada
 except ImportError:
-    from engine import procesar_sgos, exportar_excel_bytes, obtener_asistentes, guardar_datos_db, generar_reportes
+    import almacen
+    import cache
+    import snapshot
+    import subidas
+    from cache import CacheVersionada
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "sgos-secret")
+load_dotenv()  # Carga las variables del archivo .env
 
-# Configuración de Login
+# Extensiones y rutas sin app: se enlazan en create_app()
+db = SQLAlchemy()
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "login"
+login_manager.login_view = "sgos.login"
+bp = Blueprint("sgos", __name__)
+
+# Junto al paquete, no relativa al directorio actual: la web, flask y
+# generar_reportes.py usan la misma carpeta (y sus snapshots) desde donde se corran
+UPLOAD_FOLDER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.environ.get("SGOS_UPLOAD_FOLDER", "uploads"),
+)
+
+
+def _engine():
+    """
+    Importa engine (pandas + openpyxl) solo cuando una ruta lo necesita.
+    Así arrancar un worker o manage_users.py no paga esa importación.
+    """
+    try:
+        from sgos_web import engine
+    except ImportError:
+        import engine
+    return engine
+
+
+def _consultas():
+    """Consultas agregadas en SQL (también importa engine, por eso es perezoso)."""
+    try:
+        from sgos_web import consultas
+    except ImportError:
+        import consultas
+    return consultas
+
+
+def _motor_duckdb():
+    """Motor DuckDB (importa duckdb y engine), solo si SGOS_MOTOR=duckdb."""
+    try:
+        from sgos_web import motor_duckdb
+    except ImportError:
+        import motor_duckdb
+    return motor_duckdb
+
+
+def _opciones_engine(db_url: str) -> dict:
+    """
+    Pool de conexiones, configurable por entorno. En SQLite no aplica: el
+    archivo es local y los ajustes van por PRAGMA (ver _pragmas_sqlite).
+    """
+    if db_url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.environ.get("SGOS_DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("SGOS_DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("SGOS_DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("SGOS_DB_POOL_RECYCLE", 1800)),  # Antes que el servidor corte conexiones ociosas
+        "pool_pre_ping": os.environ.get("SGOS_DB_POOL_PRE_PING", "1") != "0",
+    }
+
+
+@event.listens_for(Engine, "connect")
+def _pragmas_sqlite(dbapi_conn, connection_record):
+    """
+    WAL: los dashboards siguen leyendo mientras una ingesta escribe (con el
+    journal por defecto, la escritura bloquea a todos los lectores).
+    synchronous=NORMAL es seguro con WAL y evita un fsync por commit.
+    busy_timeout: un segundo escritor espera en vez de fallar con "database is locked".
+    """
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode={os.environ.get('SGOS_SQLITE_JOURNAL', 'WAL')}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.environ.get('SGOS_SQLITE_BUSY_MS', 15000))}")
+    cursor.close()
 
-# Configuración de Base de Datos
-# Si no hay variable DATABASE_URL o está vacía, usa SQLite local por defecto
-db_url = os.environ.get("DATABASE_URL")
-if not db_url:
-    db_url = "sqlite:///sgos_local.db"
 
-app.config['SQLALCHEMY_DATABASE_URI'] = db_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def create_app() -> Flask:
+    """
+    Crea y configura una app: extensiones, rutas (blueprint `bp`) y comandos.
+    Cada llamada devuelve una app completa; gunicorn usa la de `app` al final
+    del módulo.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY", "sgos-secret")
+
+    # Configuración de Base de Datos
+    # Si no hay variable DATABASE_URL o está vacía, usa SQLite local por defecto
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        db_url = "sqlite:///sgos_local.db"
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _opciones_engine(db_url)
+
+    app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    app.config["MAX_CONTENT_LENGTH"] = 20 * 1024 * 1024  # 20MB por petición (ajusta si quieres)
+    # Archivos más grandes llegan por partes (ver subidas.py); este es el tope del archivo completo
+    app.config["MAX_ARCHIVO_MB"] = int(os.environ.get("SGOS_MAX_ARCHIVO_MB", 1024))
+
+    # Mantenimiento de uploads/ (ver almacen.py)
+    app.config["UPLOAD_CUOTA_MB"] = int(os.environ.get("SGOS_UPLOAD_CUOTA_MB", 500))
+    app.config["UPLOAD_MAX_DIAS"] = float(os.environ.get("SGOS_UPLOAD_MAX_DIAS", 90))
+    app.config["BARRIDO_SEGUNDOS"] = int(os.environ.get("SGOS_BARRIDO_SEGUNDOS", 3600))  # 0 = sin barrido automático
+
+    # Motor de los reportes históricos: "pandas" o "duckdb" (ver motor_duckdb.py)
+    app.config["MOTOR_ANALITICO"] = os.environ.get("SGOS_MOTOR", "pandas").lower()
+    # Calcular en segundo plano las vistas por defecto al terminar cada ingesta
+    app.config["PRECALENTAR"] = os.environ.get("SGOS_PRECALENTAR", "1") != "0"
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(reindexar_command)
+    app.cli.add_command(barrer_uploads_command)
+    return app
 
-db = SQLAlchemy(app)
 
 # --- MODELOS ---
 class User(UserMixin, db.Model):
@@ -97,10 +209,106 @@ class Premio(db.Model):
     def __repr__(self):
         return f"<Premio {self.id} - {self.attendant} - {self.monto}>"
 
-# Crear tablas si no existen (solo para desarrollo local/inicial)
-with app.app_context():
+class VersionDatos(db.Model):
+    """Versión de datos por tipo (GETNET / PREMIOS); sube en cada guardar_datos_db."""
+    __tablename__ = 'versiones_datos'
+
+    tipo = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<VersionDatos {self.tipo} v{self.version}>"
+
+class OpsAsistenteDia(db.Model):
+    """Índice: operaciones por asistente y jornada. Lo mantiene guardar_datos_db por mes."""
+    __tablename__ = 'ops_asistente_dia'
+    __table_args__ = (
+        db.UniqueConstraint('tipo', 'attendant', 'jornada_dia'),
+        db.Index('ix_ops_asistente_dia_tipo_mes', 'tipo', 'mes'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    attendant = db.Column(db.String(100), nullable=False)
+    jornada_dia = db.Column(db.Date, nullable=False)
+    mes = db.Column(db.String(7), nullable=False)
+    operaciones = db.Column(db.Integer, nullable=False, default=0)
+    monto = db.Column(db.Float, default=0.0)
+
+class RecordAsistente(db.Model):
+    """Récords por asistente derivados de OpsAsistenteDia; una fila por (tipo, asistente)."""
+    __tablename__ = 'record_asistentes'
+
+    tipo = db.Column(db.String(20), primary_key=True)
+    attendant = db.Column(db.String(100), primary_key=True)
+    mejor_jornada = db.Column(db.Date)
+    ops_mejor_jornada = db.Column(db.Integer, default=0)
+    mejor_mes = db.Column(db.String(7))
+    ops_mejor_mes = db.Column(db.Integer, default=0)
+    ops_7d = db.Column(db.Integer, default=0)
+    ops_30d = db.Column(db.Integer, default=0)
+    total_operaciones = db.Column(db.Integer, default=0)
+    referencia = db.Column(db.Date)  # Última jornada cargada al calcular las ventanas 7/30 días
+
+class MaquinaMes(db.Model):
+    """Índice de Premios por máquina (MDA) y mes: conteo por categoría y monto de premios."""
+    __tablename__ = 'mda_mes'
+    __table_args__ = (db.Index('ix_mda_mes_mes', 'mes'),)
+
+    maquina = db.Column(db.String(50), primary_key=True)
+    mes = db.Column(db.String(7), primary_key=True)
+    operaciones = db.Column(db.Integer, default=0)
+    premios = db.Column(db.Integer, default=0)
+    monto = db.Column(db.Float, default=0.0)  # Solo de la categoría Premios
+    mdc_purse_clear = db.Column(db.Integer, default=0)
+    cancel_credit = db.Column(db.Integer, default=0)
+    chip_cash_handpay = db.Column(db.Integer, default=0)
+
+class MaquinaHora(db.Model):
+    """Índice de Premios por máquina, mes y hora."""
+    __tablename__ = 'mda_hora'
+    __table_args__ = (db.Index('ix_mda_hora_mes', 'mes'),)
+
+    maquina = db.Column(db.String(50), primary_key=True)
+    mes = db.Column(db.String(7), primary_key=True)
+    hora = db.Column(db.Integer, primary_key=True)
+    operaciones = db.Column(db.Integer, default=0)
+    premios = db.Column(db.Integer, default=0)
+    monto = db.Column(db.Float, default=0.0)
+
+class ArchivoIngerido(db.Model):
+    """
+    Hash de contenido de cada archivo cargado en la BD, para no reprocesar
+    duplicados. Si otro archivo reemplaza alguno de sus meses deja de estar
+    vigente (ver engine.registrar_archivo), pero la fila queda: el archivo
+    sigue siendo un upload ya ingerido que el barrido puede compactar.
+    """
+    __tablename__ = 'archivos_ingeridos'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    archivo = db.Column(db.String(300), nullable=False)  # Nombre guardado en uploads/
+    nombre_original = db.Column(db.String(300))
+    tipo = db.Column(db.String(20), nullable=False)
+    meses = db.Column(db.String(500), nullable=False)  # YYYY-MM separados por coma
+    registros = db.Column(db.Integer, default=0)
+    creado = db.Column(db.DateTime)
+    vigente = db.Column(db.Boolean, default=True)  # Sus meses siguen en la BD tal como los cargó
+
+MODELOS_POR_TIPO = {"GETNET": Operacion, "PREMIOS": Premio}
+
+def init_db():
+    """
+    Crea las tablas que falten y el usuario admin por defecto.
+    Es un paso de despliegue (flask init-db), no se ejecuta al importar.
+    """
     db.create_all()
-    
+
+    # create_all no agrega columnas a tablas que ya existían
+    columnas = {c["name"] for c in inspect(db.engine).get_columns(ArchivoIngerido.__tablename__)}
+    if "vigente" not in columnas:
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {ArchivoIngerido.__tablename__} ADD COLUMN vigente BOOLEAN DEFAULT TRUE"))
+
     # Crear usuario admin por defecto si no existe
     if not User.query.filter_by(username="admin").first():
         admin = User(username="admin")
@@ -109,10 +317,106 @@ with app.app_context():
         db.session.commit()
         print("Usuario 'admin' creado con contraseña 'admin123'")
 
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-app.config["MAX_CONTENT_LENGTH"] = 20 * 1024 * 1024  # 20MB (ajusta si quieres)
+    # Una fila por tipo, así incrementar_version siempre hace UPDATE
+    for tipo in MODELOS_POR_TIPO:
+        if db.session.get(VersionDatos, tipo) is None:
+            db.session.add(VersionDatos(tipo=tipo, version=0))
+    db.session.commit()
+
+    # Se corre en cada despliegue: lo cacheado en disco con el código anterior no sirve
+    cache_reportes.vaciar_disco()
+
+
+@click.command("init-db")
+def init_db_command():
+    """Crea el esquema de la base de datos y el usuario admin."""
+    init_db()
+    print("Base de datos inicializada.")
+
+
+@click.command("reindexar")
+def reindexar_command():
+    """Reconstruye los índices (asistentes y máquinas) desde los datos ya guardados."""
+    engine = _engine()
+    for tipo in MODELOS_POR_TIPO:
+        df = get_premios_dataframe() if tipo == "PREMIOS" else get_db_dataframe()
+        # Desde cero: también se van los meses que ya no están en la tabla
+        db.session.query(OpsAsistenteDia).filter(OpsAsistenteDia.tipo == tipo).delete(synchronize_session=False)
+        db.session.query(RecordAsistente).filter(RecordAsistente.tipo == tipo).delete(synchronize_session=False)
+        if tipo == "PREMIOS":
+            db.session.query(MaquinaMes).delete(synchronize_session=False)
+            db.session.query(MaquinaHora).delete(synchronize_session=False)
+
+        # Tabla vacía: sin columnas de engine (ver get_db_dataframe), no hay nada que agrupar
+        if not df.empty:
+            meses = df["Mes"].unique()
+            engine.actualizar_indice_asistentes(db, df, tipo, meses, OpsAsistenteDia, RecordAsistente)
+            if tipo == "PREMIOS":
+                engine.actualizar_indice_maquinas(db, df, meses, MaquinaMes, MaquinaHora)
+        # Los récords cambian: las vistas cacheadas (también las de disco) deben recalcularse
+        engine.incrementar_version(db, VersionDatos, tipo)
+        db.session.commit()
+        actualizar_snapshot(tipo)
+        print(f"{tipo}: {len(df)} filas indexadas.")
+    # Los índices se rearmaron con el código actual: nada de lo cacheado antes se reutiliza
+    cache_reportes.vaciar_disco()
+
+
+def barrer_uploads(app: Flask) -> dict | None:
+    """
+    Compacta lo ya ingerido y aplica expiración y cuota sobre uploads/ de
+    `app`. Recibe la app porque también corre en el hilo del barrido periódico.
+    """
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    with app.app_context():
+        # Vigentes o no: todo lo que se cargó alguna vez ya se puede compactar
+        ingeridos = {a.archivo for a in ArchivoIngerido.query.all()}
+        # El snapshot vigente de cada tabla y la caché compartida de esa versión nunca se borran
+        versiones = {tipo: obtener_version(tipo) for tipo in MODELOS_POR_TIPO}
+        protegidos = {
+            snapshot.ruta_snapshot(_carpeta_snapshots(), Model.__tablename__, versiones[tipo])
+            for tipo, Model in MODELOS_POR_TIPO.items()
+        } | cache_reportes.rutas_vigentes(versiones)
+        db.session.remove()
+
+    return almacen.barrer(
+        app.config["UPLOAD_FOLDER"],
+        cuota_bytes=app.config["UPLOAD_CUOTA_MB"] * 1024 * 1024,
+        max_dias=app.config["UPLOAD_MAX_DIAS"],
+        ingeridos=ingeridos,
+        protegidos=protegidos,
+        cargar=_engine()._cargar_df,
+        vencimiento_lock=max(app.config["BARRIDO_SEGUNDOS"], 600),
+    )
+
+
+@click.command("barrer-uploads")
+def barrer_uploads_command():
+    """Ejecuta ahora un barrido de uploads/ (compactación, expiración y cuota)."""
+    resumen = barrer_uploads(current_app._get_current_object())
+    print(resumen if resumen is not None else "Otro proceso está barriendo; intenta más tarde.")
+
+
+cache_reportes = CacheVersionada(carpeta=os.path.join(UPLOAD_FOLDER, cache.SUBCARPETA))
+
+_arranque_lock = threading.Lock()
+
+
+@bp.before_app_request
+def _arrancar_servicio():
+    """
+    Lo que solo hace falta para servir, una vez por proceso (y app) en su
+    primera petición: la carpeta de uploads y el barrido periódico. Importar
+    la app (flask init-db, manage_users.py, generar_reportes.py) no tiene efectos.
+    """
+    app = current_app._get_current_object()
+    if app.extensions.get("sgos_arrancado"):
+        return
+    with _arranque_lock:
+        if not app.extensions.get("sgos_arrancado"):
+            os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+            almacen.iniciar_barrido_periodico(app.config["BARRIDO_SEGUNDOS"], lambda: barrer_uploads(app))
+            app.extensions["sgos_arrancado"] = True
 
 ALLOWED_EXT = {".xlsx", ".xls"}
 TABLAS_NO_FILTRAR = {
@@ -123,6 +427,77 @@ TABLAS_NO_FILTRAR = {
 }
 
 
+CHUNK_UPLOAD = 1024 * 1024  # 1MB
+
+
+def guardar_stream(stream, path: str) -> str:
+    """Escribe el stream a disco por bloques y devuelve su sha256, sin cargar el archivo entero en memoria."""
+    h = hashlib.sha256()
+    with open(path, "wb") as out:
+        for bloque in iter(lambda: stream.read(CHUNK_UPLOAD), b""):
+            h.update(bloque)
+            out.write(bloque)
+    return h.hexdigest()
+
+
+def _ya_ingerido(previo: ArchivoIngerido, path: str, saved_name: str) -> tuple[str, str]:
+    """Respuesta de ingerir_archivo para un contenido ya cargado: se queda una sola copia en uploads/."""
+    existente = almacen.ruta_datos(os.path.join(current_app.config["UPLOAD_FOLDER"], previo.archivo))
+    if existente and existente != path:
+        os.remove(path)
+        saved_name = previo.archivo
+    else:
+        previo.archivo = saved_name
+        db.session.commit()
+    return saved_name, f"Este archivo ya estaba cargado ({previo.registros} registros de tipo {previo.tipo}); no se volvió a procesar."
+
+
+def ingerir_archivo(path: str, saved_name: str, nombre_original: str, sha256: str) -> tuple[str, str]:
+    """
+    Carga el archivo en la BD salvo que ese mismo contenido ya esté ingerido
+    y vigente (si otro archivo reemplazó sus meses, se vuelve a cargar).
+    Devuelve el nombre (en uploads/) del archivo que debe mostrar el dashboard
+    (si era duplicado, el que ya estaba guardado, y la copia nueva se borra)
+    y el mensaje para el usuario. No usa flash: también corre fuera de una
+    petición, al completar una subida por partes.
+    """
+    previo = db.session.get(ArchivoIngerido, sha256)
+    if previo is not None and previo.vigente:
+        return _ya_ingerido(previo, path, saved_name)
+    if previo is not None:
+        # Mismo contenido que uno reemplazado: se recarga desde la copia que ya
+        # estaba (si sigue sin compactar), así uploads/ no guarda dos iguales
+        anterior = os.path.join(current_app.config["UPLOAD_FOLDER"], previo.archivo)
+        if os.path.exists(anterior) and os.path.abspath(anterior) != os.path.abspath(path):
+            os.remove(path)
+            path, saved_name = anterior, previo.archivo
+
+    try:
+        total_guardados, tipo_archivo = _engine().guardar_datos_db(
+            path, db, Operacion, Premio, VersionModel=VersionDatos,
+            IndiceModel=OpsAsistenteDia, RecordModel=RecordAsistente,
+            MaquinaMesModel=MaquinaMes, MaquinaHoraModel=MaquinaHora,
+            ArchivoModel=ArchivoIngerido,
+            archivo_info={"sha256": sha256, "archivo": saved_name, "nombre_original": nombre_original}
+        )
+        if total_guardados:
+            actualizar_snapshot(tipo_archivo)
+            if current_app.config["PRECALENTAR"]:
+                _precalentar_en_segundo_plano(tipo_archivo)
+        mensaje = f"¡Éxito! Se guardaron {total_guardados} registros de tipo {tipo_archivo} en la base de datos."
+    except IntegrityError as e:
+        # El mismo archivo subido dos veces a la vez: la otra petición lo
+        # registró primero (clave primaria sha256) y esta transacción se descartó
+        db.session.rollback()
+        previo = db.session.get(ArchivoIngerido, sha256)
+        if previo is None:
+            return saved_name, f"Error al guardar en base de datos: {str(e)}"
+        return _ya_ingerido(previo, path, saved_name)
+    except Exception as e:
+        mensaje = f"Error al guardar en base de datos: {str(e)}"
+    return saved_name, mensaje
+
+
 def allowed_file(filename: str) -> bool:
     _, ext = os.path.splitext(filename.lower())
     return ext in ALLOWED_EXT
@@ -133,8 +508,8 @@ def safe_file_path(file_id: str) -> str:
     Evita path traversal: normaliza y obliga a estar dentro de uploads.
     """
     file_id = secure_filename(file_id)
-    path = os.path.abspath(os.path.join(app.config["UPLOAD_FOLDER"], file_id))
-    base = os.path.abspath(app.config["UPLOAD_FOLDER"])
+    path = os.path.abspath(os.path.join(current_app.config["UPLOAD_FOLDER"], file_id))
+    base = os.path.abspath(current_app.config["UPLOAD_FOLDER"])
     if not path.startswith(base + os.sep):
         abort(400, "file_id inválido.")
     return path
@@ -153,18 +528,18 @@ def preparar_tablas(path: str, opciones: list[str], asistentes_sel: list[str]) -
     - Si NO hay filtro: todo sin filtrar
     - Aplica 'opciones' al final
     """
-    tablas_base = procesar_sgos(path)  # 1 vez siempre
+    tablas_base = _engine().procesar_sgos(path)  # 1 vez siempre
 
     # Si no hay selección o viene vacío, devolvemos base con opciones
     if not asistentes_sel:
         return aplicar_opciones(tablas_base, opciones)
 
     # Si seleccionaron TODOS, no hace falta reprocesar filtrado
-    asistentes_disponibles = obtener_asistentes(path)
+    asistentes_disponibles = _engine().obtener_asistentes(path)
     if set(asistentes_sel) == set(asistentes_disponibles):
         return aplicar_opciones(tablas_base, opciones)
 
-    tablas_filtradas = procesar_sgos(path, asistentes_filtro=asistentes_sel)  # 2da (solo si aplica)
+    tablas_filtradas = _engine().procesar_sgos(path, asistentes_filtro=asistentes_sel)  # 2da (solo si aplica)
 
     # Forzar que ciertas tablas queden sin filtro
     for nombre in TABLAS_NO_FILTRAR:
@@ -181,10 +556,10 @@ def tablas_a_html(tablas: dict) -> dict:
     }
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
+        return redirect(url_for("sgos.index"))
         
     if request.method == "POST":
         username = request.form.get("username")
@@ -193,45 +568,42 @@ def login():
         
         if user and user.check_password(password):
             login_user(user)
-            return redirect(url_for("index"))
+            return redirect(url_for("sgos.index"))
         else:
             flash("Usuario o contraseña incorrectos.")
             
     return render_template("login.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for("login"))
+    return redirect(url_for("sgos.login"))
 
 
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
 @login_required
 def index():
     if request.method == "POST":
         f = request.files.get("file")
         if not f or f.filename == "":
             flash("No se subió ningún archivo.")
-            return redirect(url_for("index"))
+            return redirect(url_for("sgos.index"))
 
         if not allowed_file(f.filename):
             flash("Formato no permitido. Sube un .xlsx o .xls")
-            return redirect(url_for("index"))
+            return redirect(url_for("sgos.index"))
 
         filename = secure_filename(f.filename)
         token = uuid.uuid4().hex
         saved_name = f"{token}__{filename}"
-        path = os.path.join(app.config["UPLOAD_FOLDER"], saved_name)
-        f.save(path)
+        path = os.path.join(current_app.config["UPLOAD_FOLDER"], saved_name)
+        sha256 = guardar_stream(f.stream, path)
 
-        # --- NUEVO: Guardar en Base de Datos ---
-        try:
-            total_guardados, tipo_archivo = guardar_datos_db(path, db, Operacion, Premio)
-            flash(f"¡Éxito! Se guardaron {total_guardados} registros de tipo {tipo_archivo} en la base de datos.")
-        except Exception as e:
-            flash(f"Error al guardar en base de datos: {str(e)}")
+        # Guardar en Base de Datos (o reutilizar si el contenido ya se cargó)
+        saved_name, mensaje = ingerir_archivo(path, saved_name, f.filename, sha256)
+        flash(mensaje)
 
         opciones = request.form.getlist("opciones")  # lo que marcó en index
         session[f"tablas_{saved_name}"] = opciones
@@ -241,26 +613,162 @@ def index():
         # Guardamos solo selección (por defecto: vacío => se interpreta como "todos").
         session[f"asistentes_sel_{saved_name}"] = []
 
-        return redirect(url_for("dashboard", file_id=saved_name))
+        return redirect(url_for("sgos.dashboard", file_id=saved_name))
 
     return render_template("index.html")
 
 
-@app.route("/dashboard/<file_id>", methods=["GET", "POST"])
+# --- Subida por partes (reanudable) ---
+# El formulario de index.html usa estas rutas desde JS; el POST clásico de
+# index queda para navegadores sin JS y archivos bajo MAX_CONTENT_LENGTH.
+BLOQUE_SUBIDA = 8 * 1024 * 1024  # 8MB por petición, bajo MAX_CONTENT_LENGTH
+
+
+def _estado_subida_json(estado: dict) -> dict:
+    return {k: estado.get(k) for k in ("id", "nombre", "tamano", "recibido", "etapa", "mensaje")}
+
+
+def _leer_subida(id_subida: str) -> dict | None:
+    try:
+        return subidas.leer(current_app.config["UPLOAD_FOLDER"], id_subida)
+    except subidas.SubidaInvalida:  # id mal formado
+        return None
+
+
+def _ingerir_en_segundo_plano(id_subida: str, path: str, saved_name: str, nombre: str, sha256: str) -> None:
+    """
+    Ingiere el archivo armado en un hilo, para no dejar la petición colgada
+    mientras se procesa. El latido (subidas.latiendo) deja ver a los demás
+    workers si este proceso murió a medio camino.
+    """
+    app = current_app._get_current_object()
+    carpeta = app.config["UPLOAD_FOLDER"]
+
+    def _tarea():
+        with app.app_context():
+            try:
+                with subidas.latiendo(carpeta, id_subida):
+                    archivo, mensaje = ingerir_archivo(path, saved_name, nombre, sha256)
+                subidas.actualizar(carpeta, id_subida, etapa="listo", archivo=archivo, mensaje=mensaje)
+            except Exception as e:
+                subidas.actualizar(carpeta, id_subida, etapa="error", mensaje=f"Error al procesar el archivo: {e}")
+
+    threading.Thread(target=_tarea, name=f"ingesta-{id_subida}", daemon=True).start()
+
+
+@bp.route("/upload/iniciar", methods=["POST"])
+@login_required
+def upload_iniciar():
+    datos = request.get_json(silent=True) or {}
+    nombre = str(datos.get("nombre") or "")
+    try:
+        tamano = int(datos.get("tamano"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Falta el tamaño del archivo."}), 400
+
+    if not nombre or not allowed_file(nombre):
+        return jsonify({"error": "Formato no permitido. Sube un .xlsx o .xls"}), 400
+    if tamano <= 0:
+        return jsonify({"error": "El archivo está vacío."}), 400
+    if tamano > current_app.config["MAX_ARCHIVO_MB"] * 1024 * 1024:
+        return jsonify({"error": f"El archivo supera el máximo de {current_app.config['MAX_ARCHIVO_MB']} MB."}), 413
+    sha256 = datos.get("sha256")
+    if sha256 is not None and not (isinstance(sha256, str) and re.fullmatch(r"[0-9a-fA-F]{64}", sha256)):
+        return jsonify({"error": "El sha256 debe ser un hash hexadecimal de 64 caracteres."}), 400
+
+    estado = subidas.crear(current_app.config["UPLOAD_FOLDER"], nombre, tamano, sha256)
+    return jsonify({**_estado_subida_json(estado), "recibido": 0, "bloque": BLOQUE_SUBIDA}), 201
+
+
+@bp.route("/upload/<id_subida>", methods=["GET"])
+@login_required
+def upload_estado(id_subida):
+    estado = _leer_subida(id_subida)
+    if estado is None:
+        return jsonify({"error": "La subida no existe."}), 404
+    return jsonify({**_estado_subida_json(estado), "bloque": BLOQUE_SUBIDA})
+
+
+@bp.route("/upload/<id_subida>", methods=["PUT"])
+@login_required
+def upload_bloque(id_subida):
+    """
+    Cuerpo crudo (application/octet-stream) con los bytes desde ?offset=N.
+    Opcional: X-Bloque-Sha256 con el sha256 del cuerpo, para descartar un bloque dañado.
+    """
+    carpeta = current_app.config["UPLOAD_FOLDER"]
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Falta el offset."}), 400
+    try:
+        recibido = subidas.escribir_bloque(
+            carpeta, id_subida, offset, request.stream, request.headers.get("X-Bloque-Sha256")
+        )
+    except subidas.SubidaInvalida as e:
+        # 409 con lo que sí hay en disco: el cliente retoma desde ahí
+        estado = _leer_subida(id_subida)
+        return jsonify({"error": str(e), "recibido": estado["recibido"] if estado else None}), 409
+    return jsonify({"recibido": recibido})
+
+
+@bp.route("/upload/<id_subida>/completar", methods=["POST"])
+@login_required
+def upload_completar(id_subida):
+    carpeta = current_app.config["UPLOAD_FOLDER"]
+    estado = _leer_subida(id_subida)
+    if estado is None:
+        return jsonify({"error": "La subida no existe."}), 404
+    try:
+        saved_name = f"{id_subida}__{secure_filename(estado['nombre'])}"
+        path = os.path.join(carpeta, saved_name)
+        sha256 = subidas.ensamblar(carpeta, id_subida, path)
+    except subidas.SubidaInvalida as e:
+        return jsonify({"error": str(e)}), 409
+
+    _ingerir_en_segundo_plano(id_subida, path, saved_name, estado["nombre"], sha256)
+    return jsonify({"id": id_subida, "etapa": "procesando"}), 202
+
+
+@bp.route("/upload/<id_subida>/abrir")
+@login_required
+def upload_abrir(id_subida):
+    """Destino del navegador cuando la ingesta terminó: muestra el mensaje y abre el dashboard."""
+    carpeta = current_app.config["UPLOAD_FOLDER"]
+    estado = _leer_subida(id_subida)
+    if estado is None:
+        abort(404)
+    if estado["etapa"] in ("subiendo", "procesando"):
+        flash("El archivo todavía se está procesando; intenta en unos segundos.")
+        return redirect(url_for("sgos.index"))
+
+    subidas.descartar(carpeta, id_subida)
+    flash(estado["mensaje"])
+    if estado["etapa"] == "error" or not estado["archivo"]:
+        return redirect(url_for("sgos.index"))
+
+    saved_name = estado["archivo"]
+    session[f"tablas_{saved_name}"] = []
+    session[f"asistentes_sel_{saved_name}"] = []
+    return redirect(url_for("sgos.dashboard", file_id=saved_name))
+
+
+@bp.route("/dashboard/<file_id>", methods=["GET", "POST"])
 @login_required
 def dashboard(file_id):
-    path = safe_file_path(file_id)
-    if not os.path.exists(path):
+    # Puede estar compactado a .parquet por el barrido de uploads
+    path = almacen.ruta_datos(safe_file_path(file_id))
+    if path is None:
         return "Archivo no encontrado.", 404
+    almacen.tocar(path)
 
-    asistentes_disponibles = obtener_asistentes(path)
+    asistentes_disponibles = _engine().obtener_asistentes(path)
 
     if request.method == "POST":
         asistentes_sel = request.form.getlist("asistentes")
         # Si el usuario no marca nada, lo tratamos como "todos" (vacío)
         # Si prefieres lo contrario, cámbialo.
         session[f"asistentes_sel_{file_id}"] = asistentes_sel
-        return redirect(url_for("dashboard", file_id=file_id))
+        return redirect(url_for("sgos.dashboard", file_id=file_id))
 
     opciones = session.get(f"tablas_{file_id}", [])
     asistentes_sel = session.get(f"asistentes_sel_{file_id}", [])
@@ -278,10 +786,178 @@ def dashboard(file_id):
     )
 
 
-def get_db_dataframe():
-    """Consulta la base de datos y devuelve un DataFrame con el formato esperado por engine.py"""
+def _carpeta_snapshots() -> str:
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], snapshot.SUBCARPETA)
+
+
+LECTURA_BLOQUE = 50_000  # Filas por bloque al leer una tabla completa
+
+
+def _bloques_tabla_db(Model):
+    """
+    Recorre la tabla completa en DataFrames de LECTURA_BLOQUE filas, con SQL
+    Core (select de la Table, sin pasar por entidades ORM). En PostgreSQL el
+    cursor es del servidor (stream_results): cada bloque llega recién cuando
+    se pide, así que si quien consume no los acumula hay uno a la vez en memoria.
+    En SQLite las fechas se traen como texto y pandas las parsea vectorizado,
+    mucho más rápido que la conversión fila a fila de SQLAlchemy.
+    """
+    import pandas as pd
+
+    tabla = Model.__table__
+    es_sqlite = db.engine.dialect.name == "sqlite"
+    fechas = [c.name for c in tabla.columns if isinstance(c.type, db.DateTime)]
+    columnas = [
+        cast(c, db.String).label(c.name) if es_sqlite and c.name in fechas else c
+        for c in tabla.columns
+    ]
+
     with db.engine.connect() as conn:
-        df = pd.read_sql(select(Operacion), conn)
+        conn = conn.execution_options(stream_results=True)
+        for bloque in pd.read_sql(select(*columnas), conn, chunksize=LECTURA_BLOQUE):
+            if es_sqlite:
+                for nombre in fechas:
+                    bloque[nombre] = pd.to_datetime(bloque[nombre], format="ISO8601")
+            yield bloque
+
+
+def _leer_tabla_db(Model):
+    """
+    La tabla completa como DataFrame, para cuando no hay snapshot (sin pyarrow,
+    o se ingirió algo mientras se escribía). Aquí sí se juntan todas las filas
+    en memoria.
+    """
+    import pandas as pd
+
+    bloques = list(_bloques_tabla_db(Model))
+    df = pd.concat(bloques, ignore_index=True) if len(bloques) > 1 else bloques[0]
+    for c in Model.__table__.columns:
+        # Un bloque con la columna toda en NULL sale como object y arrastra al resto
+        if isinstance(c.type, (db.Float, db.Integer)) and df[c.name].dtype == object and df[c.name].notna().any():
+            df[c.name] = pd.to_numeric(df[c.name])
+    return df
+
+
+def _esquema_arrow(Model):
+    """Tipos Arrow fijos por columna del modelo: no dependen de lo que traiga cada bloque."""
+    import pyarrow as pa
+
+    def tipo(c):
+        if isinstance(c.type, db.DateTime):
+            return pa.timestamp("ns")
+        if isinstance(c.type, db.Integer):
+            return pa.int64()
+        if isinstance(c.type, db.Float):
+            return pa.float64()
+        return pa.string()
+
+    return pa.schema([pa.field(c.name, tipo(c)) for c in Model.__table__.columns])
+
+
+def _crear_snapshot(tipo: str, version: int) -> bool:
+    """
+    Escribe el snapshot de `tipo` bloque a bloque desde la BD (cada bloque va
+    como RecordBatch al archivo y se suelta). Solo se etiqueta con `version`
+    si nadie ingirió mientras leíamos; devuelve si quedó escrito.
+    """
+    import pyarrow as pa
+
+    Model = MODELOS_POR_TIPO[tipo]
+    esquema = _esquema_arrow(Model)
+    bloques = (
+        pa.RecordBatch.from_pandas(bloque, schema=esquema, preserve_index=False)
+        for bloque in _bloques_tabla_db(Model)
+        if len(bloque)
+    )
+    return snapshot.escribir_snapshot(
+        _carpeta_snapshots(), Model.__tablename__, version, esquema, bloques,
+        vigente=lambda: obtener_version(tipo) == version,
+    )
+
+
+def obtener_version(tipo: str) -> int:
+    """Versión de datos vigente de GETNET / PREMIOS (0 si nunca se cargó nada)."""
+    version = db.session.execute(
+        select(VersionDatos.version).where(VersionDatos.tipo == tipo)
+    ).scalar()
+    return version or 0
+
+
+def _leer_tabla(tipo: str, desde: str | None = None, hasta: str | None = None):
+    """
+    Devuelve la tabla completa (columnas de la BD), o solo los meses entre
+    `desde` y `hasta` (YYYY-MM, inclusive). Usa el snapshot Arrow compartido
+    entre workers; si no existe para la versión vigente, lo crea.
+    Las columnas del snapshot quedan como ArrowDtype sobre los buffers
+    mapeados: ni números ni textos se copian a la memoria del worker (con
+    rango, solo se copian las filas de esos meses).
+    """
+    import pandas as pd
+
+    Model = MODELOS_POR_TIPO[tipo]
+    version = obtener_version(tipo)
+    table = snapshot.leer_snapshot(_carpeta_snapshots(), Model.__tablename__, version)
+    if table is None and snapshot.disponible() and _crear_snapshot(tipo, version):
+        table = snapshot.leer_snapshot(_carpeta_snapshots(), Model.__tablename__, version)
+    if table is not None:
+        if desde or hasta:
+            import pyarrow.compute as pc
+
+            filtro = pc.field("mes").is_valid()
+            if desde:
+                filtro &= pc.field("mes") >= desde
+            if hasta:
+                filtro &= pc.field("mes") <= hasta
+            table = table.filter(filtro)
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    df = _leer_tabla_db(Model)
+    if desde:
+        df = df[df["mes"] >= desde]
+    if hasta:
+        df = df[df["mes"] <= hasta]
+    return df
+
+
+def _tabla_arrow(tipo: str):
+    """
+    (pyarrow.Table mapeada del snapshot vigente, su versión); crea el snapshot
+    si falta. (None, version) si no hay pyarrow o se ingirió algo mientras se creaba.
+    """
+    version = obtener_version(tipo)
+    if not snapshot.disponible():
+        return None, version
+    Model = MODELOS_POR_TIPO[tipo]
+    table = snapshot.leer_snapshot(_carpeta_snapshots(), Model.__tablename__, version)
+    if table is None and _crear_snapshot(tipo, version):
+        table = snapshot.leer_snapshot(_carpeta_snapshots(), Model.__tablename__, version)
+    return table, version
+
+
+def actualizar_snapshot(tipo: str):
+    """Escribe el snapshot de la versión recién ingerida, para que ningún worker lo pague."""
+    if not snapshot.disponible():
+        return
+    Model = MODELOS_POR_TIPO[tipo]
+    version = obtener_version(tipo)
+    if not snapshot.existe(_carpeta_snapshots(), Model.__tablename__, version):
+        _crear_snapshot(tipo, version)
+
+    if current_app.config["MOTOR_ANALITICO"] == "duckdb" and _motor_duckdb().disponible():
+        # La clasificación de pagos de DuckDB para esta versión también queda lista al ingerir
+        table, version = _tabla_arrow(tipo)
+        if table is not None:
+            _motor_duckdb().preparar_fuente(table, Model.__tablename__, version)
+
+
+def get_db_dataframe(desde: str | None = None, hasta: str | None = None):
+    """
+    Consulta la base de datos y devuelve un DataFrame con el formato esperado
+    por engine.py (solo los meses entre `desde` y `hasta`, si se indican).
+    """
+    import pandas as pd
+
+    df = _leer_tabla("GETNET", desde, hasta)
     
     if df.empty:
         return df
@@ -297,17 +973,18 @@ def get_db_dataframe():
         "forma_pago": "FormaPago"
     })
     
-    # Calcular JornadaDia
-    df["JornadaDia"] = pd.to_datetime(df["Jornada"]).dt.normalize()
+    # Calcular JornadaDia (datetime64 de numpy también si la tabla viene del snapshot)
+    df["JornadaDia"] = pd.to_datetime(df["Jornada"]).dt.normalize().astype("datetime64[ns]")
     df["Tipo"] = "GETNET"
     
     return df
 
 
-def get_premios_dataframe():
-    """Consulta la base de datos de PREMIOS y devuelve un DataFrame"""
-    with db.engine.connect() as conn:
-        df = pd.read_sql(select(Premio), conn)
+def get_premios_dataframe(desde: str | None = None, hasta: str | None = None):
+    """Consulta la base de datos de PREMIOS y devuelve un DataFrame (opcionalmente de `desde` a `hasta`)"""
+    import pandas as pd
+
+    df = _leer_tabla("PREMIOS", desde, hasta)
     
     if df.empty:
         return df
@@ -324,116 +1001,200 @@ def get_premios_dataframe():
         "maquina": "Maquina"
     })
     
-    # Calcular JornadaDia
-    df["JornadaDia"] = pd.to_datetime(df["Jornada"]).dt.normalize()
+    # Calcular JornadaDia (datetime64 de numpy también si la tabla viene del snapshot)
+    df["JornadaDia"] = pd.to_datetime(df["Jornada"]).dt.normalize().astype("datetime64[ns]")
     df["Tipo"] = "PREMIOS"
     
     return df
 
 
-@app.route("/dashboard_db", methods=["GET", "POST"])
-@login_required
-def dashboard_db():
-    df = get_db_dataframe()
-    
-    if df.empty:
-        flash("No hay datos de Getnet en la base de datos.")
-        return redirect(url_for("index"))
+def _etag(*partes) -> str:
+    return hashlib.sha1(repr(partes).encode("utf-8")).hexdigest()
 
-    asistentes_disponibles = sorted(df["Attendant"].dropna().unique().tolist())
 
-    if request.method == "POST":
-        asistentes_sel = request.form.getlist("asistentes")
-        session["asistentes_sel_db"] = asistentes_sel
-        return redirect(url_for("dashboard_db"))
+def _respuesta_condicional(etag: str, generar):
+    """
+    Responde 304 si el navegador ya tiene esta versión (If-None-Match); si no,
+    genera la respuesta y le pone el ETag. Con mensajes flash pendientes siempre
+    se genera, para no tragarse el aviso.
+    """
+    if etag in request.if_none_match and not session.get("_flashes"):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(generar())
+        if resp.status_code != 200:
+            return resp
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
-    asistentes_sel = session.get("asistentes_sel_db", [])
-    asistentes_seleccionados = asistentes_sel or asistentes_disponibles
 
-    # Generar reportes usando el DataFrame directo
-    tablas = generar_reportes(df, asistentes_seleccionados)
-    
-    return render_template(
-        "dashboard.html",
-        file_id="db",
-        tablas_html=tablas_a_html(tablas),
-        asistentes_disponibles=asistentes_disponibles,
-        asistentes_seleccionados=asistentes_seleccionados,
-        titulo_dashboard="Histórico Getnet"
+def _indice_completo(tipo: str) -> bool:
+    """
+    True si el índice por asistente cubre todos los meses de la tabla. Con
+    datos previos al índice, las ingestas nuevas solo indexan sus meses y los
+    récords saldrían de una parte del histórico hasta correr `flask reindexar`.
+    Se cachea por versión: solo cambia al ingerir o reindexar.
+    """
+    Model = MODELOS_POR_TIPO[tipo]
+
+    def calcular():
+        meses_tabla = set(db.session.execute(select(Model.mes).where(Model.mes.isnot(None)).distinct()).scalars())
+        meses_indice = set(db.session.execute(
+            select(OpsAsistenteDia.mes).where(OpsAsistenteDia.tipo == tipo).distinct()
+        ).scalars())
+        return meses_tabla <= meses_indice
+
+    return cache_reportes.obtener(tipo, obtener_version(tipo), ("indice_completo",), calcular)
+
+
+def _ops_record(tipo: str):
+    """
+    Mejor jornada por asistente leída del índice (O(asistentes)).
+    None si el índice no cubre toda la tabla (ver _indice_completo): entonces
+    generar_reportes la calcula desde las filas.
+    """
+    if not _indice_completo(tipo):
+        return None
+    filas = RecordAsistente.query.filter_by(tipo=tipo).all()
+    if not filas:
+        return None
+    return _engine().record_desde_indice(filas)
+
+
+def reportes_historicos(tipo: str, asistentes_sel: list) -> dict | None:
+    """
+    Reportes del histórico GETNET / PREMIOS para la selección de asistentes,
+    cacheados por versión de datos. None si la tabla está vacía.
+    """
+    version = obtener_version(tipo)
+
+    def calcular():
+        table = None
+        if current_app.config["MOTOR_ANALITICO"] == "duckdb" and _motor_duckdb().disponible():
+            table, version_tabla = _tabla_arrow(tipo)
+
+        if table is not None:
+            # DuckDB agrega sobre el snapshot mapeado, sin copiarlo ni pasarlo a pandas
+            if table.num_rows == 0:
+                return None
+            motor = _motor_duckdb()
+            fuente = motor.preparar_fuente(table, MODELOS_POR_TIPO[tipo].__tablename__, version_tabla)
+            asistentes_disponibles = motor.listar_asistentes(fuente)
+            asistentes_seleccionados = asistentes_sel or asistentes_disponibles
+            tablas = motor.generar_reportes(fuente, tipo, asistentes_seleccionados, ops_record=_ops_record(tipo))
+        else:
+            df = get_premios_dataframe() if tipo == "PREMIOS" else get_db_dataframe()
+            if df.empty:
+                return None
+            asistentes_disponibles = sorted(df["Attendant"].dropna().unique().tolist())
+            asistentes_seleccionados = asistentes_sel or asistentes_disponibles
+            tablas = _engine().generar_reportes(df, asistentes_seleccionados, ops_record=_ops_record(tipo))
+
+        return {
+            "asistentes_disponibles": asistentes_disponibles,
+            "asistentes_seleccionados": asistentes_seleccionados,
+            "tablas": tablas,
+        }
+
+    clave = ("reportes", tuple(sorted(asistentes_sel)))
+    return cache_reportes.obtener(tipo, version, clave, calcular, compartida=not asistentes_sel)
+
+
+def tablas_html_historicas(tipo: str, version: int, clave: tuple, datos: dict) -> dict:
+    """HTML de las tablas de reportes_historicos, cacheado igual que ellas."""
+    return cache_reportes.obtener(
+        tipo, version, ("html", clave), lambda: tablas_a_html(datos["tablas"]), compartida=not clave
     )
 
 
-@app.route("/dashboard_premios", methods=["GET", "POST"])
+def _dashboard_historico(tipo: str, session_key: str, file_id: str, titulo: str):
+    asistentes_sel = session.get(session_key, [])
+    version = obtener_version(tipo)
+    clave = tuple(sorted(asistentes_sel))
+
+    def generar():
+        datos = reportes_historicos(tipo, asistentes_sel)
+        if datos is None:
+            nombre = "Premios" if tipo == "PREMIOS" else "Getnet"
+            flash(f"No hay datos de {nombre} en la base de datos.")
+            return redirect(url_for("sgos.index"))
+
+        tablas_html = tablas_html_historicas(tipo, version, clave, datos)
+        return render_template(
+            "dashboard.html",
+            file_id=file_id,
+            tablas_html=tablas_html,
+            asistentes_disponibles=datos["asistentes_disponibles"],
+            asistentes_seleccionados=datos["asistentes_seleccionados"],
+            titulo_dashboard=titulo
+        )
+
+    etag = _etag(tipo, version, current_user.get_id(), clave)
+    return _respuesta_condicional(etag, generar)
+
+
+@bp.route("/dashboard_db", methods=["GET", "POST"])
 @login_required
-def dashboard_premios():
-    df = get_premios_dataframe()
-    
-    if df.empty:
-        flash("No hay datos de Premios en la base de datos.")
-        return redirect(url_for("index"))
+def dashboard_db():
+    if request.method == "POST":
+        asistentes_sel = request.form.getlist("asistentes")
+        session["asistentes_sel_db"] = asistentes_sel
+        return redirect(url_for("sgos.dashboard_db"))
+
+    return _dashboard_historico("GETNET", "asistentes_sel_db", "db", "Histórico Getnet")
 
-    asistentes_disponibles = sorted(df["Attendant"].dropna().unique().tolist())
 
+@bp.route("/dashboard_premios", methods=["GET", "POST"])
+@login_required
+def dashboard_premios():
     if request.method == "POST":
         asistentes_sel = request.form.getlist("asistentes")
         session["asistentes_sel_premios"] = asistentes_sel
-        return redirect(url_for("dashboard_premios"))
+        return redirect(url_for("sgos.dashboard_premios"))
 
-    asistentes_sel = session.get("asistentes_sel_premios", [])
-    asistentes_seleccionados = asistentes_sel or asistentes_disponibles
-
-    # Generar reportes usando el DataFrame directo
-    tablas = generar_reportes(df, asistentes_seleccionados)
-    
-    return render_template(
-        "dashboard.html",
-        file_id="premios_db",
-        tablas_html=tablas_a_html(tablas),
-        asistentes_disponibles=asistentes_disponibles,
-        asistentes_seleccionados=asistentes_seleccionados,
-        titulo_dashboard="Histórico Premios"
-    )
+    return _dashboard_historico("PREMIOS", "asistentes_sel_premios", "premios_db", "Histórico Premios")
 
 
 @login_required
-@app.route("/download/<file_id>", methods=["GET"])
+@bp.route("/download/<file_id>", methods=["GET"])
 def download(file_id):
-    if file_id == "db":
-        df = get_db_dataframe()
-        download_name = "reporte_historico_getnet.xlsx"
-    elif file_id == "premios_db":
-        df = get_premios_dataframe()
-        download_name = "reporte_historico_premios.xlsx"
-    else:
-        df = None
-
     if file_id in ["db", "premios_db"]:
-        if df is None or df.empty:
-            return "No hay datos para descargar.", 404
-            
-        asistentes_disponibles = sorted(df["Attendant"].dropna().unique().tolist())
-        
+        tipo = "GETNET" if file_id == "db" else "PREMIOS"
+        download_name = "reporte_historico_getnet.xlsx" if tipo == "GETNET" else "reporte_historico_premios.xlsx"
+
         # Usar la sesión correcta según el tipo
         session_key = "asistentes_sel_db" if file_id == "db" else "asistentes_sel_premios"
         asistentes_sel = session.get(session_key, [])
-        asistentes_seleccionados = asistentes_sel or asistentes_disponibles
-        
-        tablas = generar_reportes(df, asistentes_seleccionados)
-        output: BytesIO = exportar_excel_bytes(tablas)
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=download_name,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-    path = safe_file_path(file_id)
-    if not os.path.exists(path):
+        version = obtener_version(tipo)
+        clave = tuple(sorted(asistentes_sel))
+
+        def generar():
+            datos = reportes_historicos(tipo, asistentes_sel)
+            if datos is None:
+                return "No hay datos para descargar.", 404
+
+            contenido = cache_reportes.obtener(
+                tipo, version, ("excel", clave),
+                lambda: _engine().exportar_excel_bytes(datos["tablas"]).getvalue()
+            )
+            return send_file(
+                BytesIO(contenido),
+                as_attachment=True,
+                download_name=download_name,
+                mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+        return _respuesta_condicional(_etag(tipo, version, "excel", clave), generar)
+
+    # Puede estar compactado a .parquet por el barrido de uploads
+    path = almacen.ruta_datos(safe_file_path(file_id))
+    if path is None:
         return "Archivo no encontrado.", 404
+    almacen.tocar(path)
 
     opciones = session.get(f"tablas_{file_id}", [])
-    asistentes_disponibles = obtener_asistentes(path)
+    asistentes_disponibles = _engine().obtener_asistentes(path)
 
     # Priorizar filtro desde URL (si viene del botón con JS)
     if request.args.get("filtered") == "true":
@@ -444,7 +1205,7 @@ def download(file_id):
     asistentes_seleccionados = asistentes_sel or asistentes_disponibles
 
     tablas = preparar_tablas(path, opciones, asistentes_seleccionados)
-    output: BytesIO = exportar_excel_bytes(tablas)
+    output: BytesIO = _engine().exportar_excel_bytes(tablas)
 
     return send_file(
         output,
@@ -454,36 +1215,231 @@ def download(file_id):
     )
 
 
-@app.route("/graphs")
+ORDENES_RANKING = {
+    "mejor_jornada": RecordAsistente.ops_mejor_jornada,
+    "mejor_mes": RecordAsistente.ops_mejor_mes,
+    "ops_7d": RecordAsistente.ops_7d,
+    "ops_30d": RecordAsistente.ops_30d,
+    "total": RecordAsistente.total_operaciones,
+}
+
+
+@bp.route("/api/ranking_asistentes")
+@login_required
+def api_ranking_asistentes():
+    """
+    Top-N de asistentes desde el índice de récords (sin tocar las filas crudas).
+    Parámetros: tipo (getnet|premios), orden (ver ORDENES_RANKING), n (por defecto 10).
+    """
+    tipo = request.args.get("tipo", "getnet").upper()
+    if tipo not in MODELOS_POR_TIPO:
+        abort(400, "tipo inválido.")
+    orden = request.args.get("orden", "mejor_jornada")
+    if orden not in ORDENES_RANKING:
+        abort(400, "orden inválido.")
+    n = request.args.get("n", 10, type=int)
+
+    version = obtener_version(tipo)
+
+    def generar():
+        filas = (
+            RecordAsistente.query
+              .filter_by(tipo=tipo)
+              .order_by(ORDENES_RANKING[orden].desc(), RecordAsistente.attendant)
+              .limit(max(1, min(n, 500)))
+              .all()
+        )
+        return jsonify({
+            "version": version,
+            "orden": orden,
+            # False: el índice no cubre todo el histórico, falta correr `flask reindexar`
+            "indice_completo": _indice_completo(tipo),
+            "referencia": filas[0].referencia.isoformat() if filas else None,
+            "ranking": [
+                {
+                    "attendant": f.attendant,
+                    "mejor_jornada": f.mejor_jornada.isoformat(),
+                    "ops_mejor_jornada": f.ops_mejor_jornada,
+                    "mejor_mes": f.mejor_mes,
+                    "ops_mejor_mes": f.ops_mejor_mes,
+                    "ops_7d": f.ops_7d,
+                    "ops_30d": f.ops_30d,
+                    "total_operaciones": f.total_operaciones,
+                }
+                for f in filas
+            ],
+        })
+
+    return _respuesta_condicional(_etag(tipo, version, "ranking", orden, n), generar)
+
+
+@bp.route("/api/maquinas/top")
+@login_required
+def api_top_maquinas():
+    """
+    Top-K máquinas de Premios desde el índice por máquina.
+    Parámetros: metrica (premios|monto|mdc_purse_clear|cancel_credit|chip_cash_handpay|operaciones),
+    k (por defecto 10), mes (YYYY-MM, opcional).
+    """
+    consultas = _consultas()
+    metrica = request.args.get("metrica", "premios")
+    if metrica not in consultas.COLUMNAS_MDA:
+        abort(400, "metrica inválida.")
+    k = max(1, min(request.args.get("k", 10, type=int), 500))
+    mes = request.args.get("mes") or None
+
+    version = obtener_version("PREMIOS")
+
+    def generar():
+        return jsonify({
+            "version": version,
+            "metrica": metrica,
+            "mes": mes,
+            "maquinas": consultas.top_maquinas(db, MaquinaMes, metrica, k, mes),
+        })
+
+    return _respuesta_condicional(_etag("PREMIOS", version, "top_maquinas", metrica, k, mes), generar)
+
+
+@bp.route("/maquina/<maquina>")
+@login_required
+def detalle_maquina(maquina):
+    """Drill-down de una máquina: sus meses y la distribución por hora (?mes=YYYY-MM para un mes)."""
+    mes = request.args.get("mes") or None
+    version = obtener_version("PREMIOS")
+
+    def generar():
+        detalle = _consultas().detalle_maquina(db, MaquinaMes, MaquinaHora, maquina, mes)
+        if detalle is None:
+            return jsonify({"error": "Máquina sin datos."}), 404
+        return jsonify({"version": version, "mes": mes, **detalle})
+
+    return _respuesta_condicional(_etag("PREMIOS", version, "maquina", maquina, mes), generar)
+
+
+@bp.route("/conciliacion")
+@login_required
+def conciliacion():
+    """
+    Excel de conciliación Premios vs Getnet (mismo cliente y asistente, ±ventana minutos).
+    Parámetros opcionales: desde / hasta (YYYY-MM), ventana (minutos).
+    """
+    desde = request.args.get("desde") or None
+    hasta = request.args.get("hasta") or None
+    ventana = request.args.get("ventana", _engine().VENTANA_CONCILIACION_MIN, type=int)
+    if ventana <= 0:
+        abort(400, "ventana inválida.")
+
+    # Depende de ambas tablas: la caché se invalida si cambia cualquiera
+    versiones = (obtener_version("GETNET"), obtener_version("PREMIOS"))
+
+    def calcular():
+        df_premios = get_premios_dataframe()
+        if df_premios.empty:
+            return None
+        meses = sorted(
+            m for m in df_premios["Mes"].unique()
+            if (not desde or m >= desde) and (not hasta or m <= hasta)
+        )
+        if not meses:
+            return None
+        engine = _engine()
+        tablas = engine.conciliar_getnet_premios(get_db_dataframe(), df_premios, ventana, meses=meses)
+        return engine.exportar_excel_bytes(tablas).getvalue()
+
+    def generar():
+        contenido = cache_reportes.obtener("CONCILIACION", versiones, (desde, hasta, ventana), calcular)
+        if contenido is None:
+            return "No hay datos de Premios para conciliar en ese rango.", 404
+        return send_file(
+            BytesIO(contenido),
+            as_attachment=True,
+            download_name="conciliacion_getnet_premios.xlsx",
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+    return _respuesta_condicional(_etag("CONCILIACION", versiones, desde, hasta, ventana), generar)
+
+
+@bp.route("/graphs")
 @login_required
 def graphs():
-    df = get_db_dataframe()
-    if df.empty:
-        # Si no hay datos, pasamos listas vacías para que no falle el JS
-        return render_template("graphs.html", 
-                               data_mes={"labels": [], "ops": [], "monto": []},
-                               data_hora={"labels": [], "ops": [], "monto": []})
+    # La página solo trae el esqueleto; las series llegan por /api/graficos
+    return render_template("graphs.html")
 
-    # Reutilizamos la lógica de engine para agrupar
-    tablas = generar_reportes(df)
-    
-    df_mes = tablas["Resumen Mensual"]
-    df_hora = tablas["Operaciones por Hora"]
 
-    data_mes = {
-        "labels": df_mes["Mes"].tolist(),
-        "ops": df_mes["Operaciones"].tolist(),
-        "monto": df_mes["Monto"].tolist()
-    }
+@bp.route("/api/graficos")
+@login_required
+def api_graficos():
+    """
+    Series para los gráficos, calculadas con GROUP BY en la BD.
+    Parámetros: tipo (getnet|premios), granularidad (diaria|semanal|mensual),
+    asistentes (repetible; vacío = todos).
+    """
+    tipo = request.args.get("tipo", "getnet").upper()
+    if tipo not in MODELOS_POR_TIPO:
+        abort(400, "tipo inválido.")
+    granularidad = request.args.get("granularidad", "mensual")
+    if granularidad not in _consultas().GRANULARIDADES:
+        abort(400, "granularidad inválida.")
+    asistentes = sorted(set(request.args.getlist("asistentes")))
+    version = obtener_version(tipo)
 
-    data_hora = {
-        "labels": df_hora["Hora"].tolist(),
-        "ops": df_hora["Operaciones"].tolist(),
-        "monto": df_hora["Monto"].tolist()
-    }
+    def generar():
+        return jsonify(series_graficos(tipo, version, granularidad, asistentes))
+
+    return _respuesta_condicional(_etag(tipo, version, "api_graficos", granularidad, asistentes), generar)
+
+
+def series_graficos(tipo: str, version: int, granularidad: str, asistentes: list) -> dict:
+    """Series de /api/graficos, cacheadas por versión de datos."""
+    Model = MODELOS_POR_TIPO[tipo]
+
+    def calcular():
+        consultas = _consultas()
+        return {
+            "version": version,
+            "granularidad": granularidad,
+            "asistentes": consultas.listar_asistentes(db, Model),
+            "periodo": consultas.serie_periodo(db, Model, granularidad, asistentes),
+            "hora": consultas.serie_horas(db, Model, asistentes),
+        }
+
+    clave = ("api_graficos", granularidad, tuple(asistentes))
+    return cache_reportes.obtener(tipo, version, clave, calcular, compartida=not asistentes)
+
+
+def precalentar(tipo: str) -> None:
+    """
+    Calcula y deja en la caché compartida lo que ve el primero que entra tras
+    una ingesta: el dashboard histórico de `tipo` sin filtro de asistentes y
+    las series de /graphs en todas las granularidades.
+    """
+    version = obtener_version(tipo)
+    datos = reportes_historicos(tipo, [])
+    if datos is not None:
+        tablas_html_historicas(tipo, version, (), datos)
+    for granularidad in _consultas().GRANULARIDADES:
+        series_graficos(tipo, version, granularidad, [])
+
+
+def _precalentar_en_segundo_plano(tipo: str) -> None:
+    app = current_app._get_current_object()
+
+    def _tarea():
+        with app.app_context():
+            try:
+                precalentar(tipo)
+            except Exception as e:
+                print(f"Precalentado de {tipo} falló: {e}")
+
+    threading.Thread(target=_tarea, name=f"precalentar-{tipo}", daemon=True).start()
 
-    return render_template("graphs.html", data_mes=data_mes, data_hora=data_hora)
 
+app = create_app()
 
 if __name__ == "__main__":
+    # En desarrollo local inicializamos el esquema antes de levantar el servidor
+    with app.app_context():
+        init_db()
     app.run(debug=True)
@@ -0,0 +1,140 @@
+"""
+Caché en memoria (por proceso) de resultados derivados de las tablas
+históricas: reportes, HTML de tablas, series de gráficos, Excel generado.
+
+Cada entrada guarda la versión de datos con la que se calculó. La versión vive
+en la BD (VersionDatos) y guardar_datos_db la incrementa en la misma
+transacción que los datos, así que cualquier worker detecta en su siguiente
+petición que la entrada quedó vieja: la invalidación es exacta sin tener que
+avisar a los demás procesos.
+
+Las entradas `compartida=True` (las vistas por defecto, que se precalientan al
+ingerir) además se guardan en disco, en `carpeta`, con la versión en el nombre:
+lo que calculó un worker lo leen los demás sin recalcular. Esos archivos
+sobreviven reinicios y despliegues, así que el nombre lleva también la firma
+del código (ver firma_codigo): tras cambiar engine.py u otro módulo, lo
+guardado por la versión anterior del código no se vuelve a servir.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+SUBCARPETA = ".cache"
+
+
+def firma_codigo() -> str:
+    """Hash corto de los .py de sgos_web: cambia con cualquier cambio de código."""
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha1()
+    for nombre in sorted(os.listdir(carpeta)):
+        if nombre.endswith(".py"):
+            with open(os.path.join(carpeta, nombre), "rb") as f:
+                h.update(nombre.encode("utf-8"))
+                h.update(f.read())
+    return h.hexdigest()[:10]
+
+
+class CacheVersionada:
+    def __init__(self, max_entradas: int = 64, carpeta: str | None = None, firma: str | None = None):
+        self.max_entradas = max_entradas
+        self.carpeta = carpeta
+        self.firma = firma or (firma_codigo() if carpeta is not None else "")
+        self._datos = OrderedDict()  # (tipo, clave) -> (version, valor)
+        self._lock = threading.Lock()
+
+    def obtener(self, tipo: str, version: int, clave, calcular, compartida: bool = False):
+        """
+        Devuelve el valor cacheado para (tipo, clave) si se calculó con
+        `version`; si no, lo calcula con calcular() y lo guarda. Con
+        `compartida`, antes de calcular busca el valor en disco y después lo
+        deja ahí para los demás workers.
+        """
+        k = (tipo, clave)
+        with self._lock:
+            entrada = self._datos.get(k)
+            if entrada is not None and entrada[0] == version:
+                self._datos.move_to_end(k)
+                return entrada[1]
+
+        compartida = compartida and self.carpeta is not None
+        valor = self._leer_disco(tipo, version, clave) if compartida else None
+        if valor is None:
+            # Se calcula fuera del lock: dos peticiones simultáneas pueden
+            # calcular lo mismo, pero ninguna bloquea a las demás vistas.
+            valor = calcular()
+            if compartida and valor is not None:
+                self._escribir_disco(tipo, version, clave, valor)
+
+        with self._lock:
+            self._datos[k] = (version, valor)
+            self._datos.move_to_end(k)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def vaciar_disco(self) -> None:
+        """Borra la caché en disco (al migrar o reindexar, los datos derivados cambian)."""
+        if self.carpeta is None or not os.path.isdir(self.carpeta):
+            return
+        for nombre in os.listdir(self.carpeta):
+            if nombre.endswith(".pkl"):
+                try:
+                    os.remove(os.path.join(self.carpeta, nombre))
+                except OSError:
+                    pass
+
+    def ruta(self, tipo: str, version: int, clave) -> str:
+        digest = hashlib.sha1(repr(clave).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.carpeta, f"{tipo}-v{version}-{self.firma}-{digest}.pkl")
+
+    def rutas_vigentes(self, versiones: dict) -> set:
+        """Archivos en disco de las versiones vigentes ({tipo: version})."""
+        if self.carpeta is None or not os.path.isdir(self.carpeta):
+            return set()
+        prefijos = tuple(f"{tipo}-v{version}-{self.firma}-" for tipo, version in versiones.items())
+        return {os.path.join(self.carpeta, n) for n in os.listdir(self.carpeta) if n.startswith(prefijos)}
+
+    def _leer_disco(self, tipo: str, version: int, clave):
+        try:
+            with open(self.ruta(tipo, version, clave), "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None  # No existe, o está corrupto: se recalcula y se pisa
+
+    def _escribir_disco(self, tipo: str, version: int, clave, valor) -> None:
+        """
+        Escritura atómica (temporal + rename); borra lo del mismo tipo de
+        versiones anteriores o de otra firma de código.
+        """
+        os.makedirs(self.carpeta, exist_ok=True)
+        destino = self.ruta(tipo, version, clave)
+        tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, destino)
+        except OSError:
+            return  # Sin disco la caché sigue funcionando en memoria
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        for nombre in os.listdir(self.carpeta):
+            if not nombre.startswith(f"{tipo}-v") or not nombre.endswith(".pkl"):
+                continue
+            partes = nombre[len(tipo) + 2:].split("-")
+            try:
+                vieja = int(partes[0])
+            except ValueError:
+                continue
+            if vieja < version or len(partes) != 3 or partes[1] != self.firma:
+                try:
+                    os.remove(os.path.join(self.carpeta, nombre))
+                except OSError:
+                    pass
@@ -0,0 +1,142 @@
+"""
+Consultas agregadas directo en la BD (GROUP BY) para vistas que no necesitan
+el pipeline completo de generar_reportes.
+
+Igual que guardar_datos_db, reciben `db` y el modelo (Operacion / Premio)
+como parámetros para no depender de app.py.
+"""
+import datetime
+
+from sqlalchemy import func, select
+
+try:
+    from sgos_web.engine import ORDEN_HORAS, _formatear_periodo
+except ImportError:
+    from engine import ORDEN_HORAS, _formatear_periodo
+
+GRANULARIDADES = ("diaria", "semanal", "mensual")
+
+
+def _filtrar_asistentes(stmt, Model, asistentes):
+    if asistentes:
+        stmt = stmt.where(Model.attendant.in_(asistentes))
+    return stmt
+
+
+def _serie(filas) -> dict:
+    return {
+        "labels": [f[0] for f in filas],
+        "ops": [int(f[1] or 0) for f in filas],
+        "monto": [float(f[2] or 0) for f in filas],
+    }
+
+
+def _por_dia(db, Model, asistentes) -> list:
+    dia = func.date(Model.jornada)
+    stmt = (
+        select(dia, func.count(Model.monto), func.sum(Model.monto))
+        .group_by(dia)
+        .order_by(dia)
+    )
+    filas = db.session.execute(_filtrar_asistentes(stmt, Model, asistentes)).all()
+    # SQLite devuelve 'YYYY-MM-DD' como texto, PostgreSQL un date
+    return [(datetime.date.fromisoformat(str(d)[:10]), ops, monto) for d, ops, monto in filas]
+
+
+def serie_periodo(db, Model, granularidad: str, asistentes: list | None = None) -> dict:
+    """Operaciones y monto por día, semana (lunes a domingo) o mes de jornada."""
+    if granularidad == "mensual":
+        stmt = (
+            select(Model.mes, func.count(Model.monto), func.sum(Model.monto))
+            .group_by(Model.mes)
+            .order_by(Model.mes)
+        )
+        filas = db.session.execute(_filtrar_asistentes(stmt, Model, asistentes)).all()
+        return _serie([(_formatear_periodo(mes), ops, monto) for mes, ops, monto in filas])
+
+    dias = _por_dia(db, Model, asistentes)
+    if granularidad == "diaria":
+        return _serie([(d.strftime("%d-%m-%Y"), ops, monto) for d, ops, monto in dias])
+
+    # Semanal: a lo más ~53 filas por año, se agrupa aquí sobre la salida diaria
+    semanas = {}
+    for d, ops, monto in dias:
+        lunes = d - datetime.timedelta(days=d.weekday())
+        acumulado = semanas.setdefault(lunes, [0, 0.0])
+        acumulado[0] += ops or 0
+        acumulado[1] += monto or 0
+    return _serie([
+        (f"Semana {lunes.strftime('%d-%m-%Y')}", ops, monto)
+        for lunes, (ops, monto) in sorted(semanas.items())
+    ])
+
+
+def serie_horas(db, Model, asistentes: list | None = None) -> dict:
+    """Operaciones y monto por hora, en el orden de la jornada (10 a 08)."""
+    stmt = (
+        select(Model.hora, func.count(Model.monto), func.sum(Model.monto))
+        .group_by(Model.hora)
+    )
+    por_hora = {h: (ops, monto) for h, ops, monto in db.session.execute(_filtrar_asistentes(stmt, Model, asistentes))}
+    return _serie([(str(h), *por_hora.get(h, (0, 0))) for h in ORDEN_HORAS])
+
+
+def listar_asistentes(db, Model) -> list:
+    stmt = select(Model.attendant).distinct().order_by(Model.attendant)
+    return [a for a in db.session.execute(stmt).scalars() if a]
+
+
+COLUMNAS_MDA = ("premios", "monto", "mdc_purse_clear", "cancel_credit", "chip_cash_handpay", "operaciones")
+
+
+def top_maquinas(db, MaquinaMesModel, metrica: str, k: int, mes: str | None = None) -> list:
+    """Las k máquinas con más `metrica` (suma sobre los meses del índice, o solo `mes`)."""
+    columnas = [func.sum(getattr(MaquinaMesModel, c)).label(c) for c in COLUMNAS_MDA]
+    stmt = select(MaquinaMesModel.maquina, *columnas).group_by(MaquinaMesModel.maquina)
+    if mes:
+        stmt = stmt.where(MaquinaMesModel.mes == mes)
+    total = func.sum(getattr(MaquinaMesModel, metrica))
+    stmt = stmt.order_by(total.desc(), MaquinaMesModel.maquina).limit(k)
+    return [
+        {"maquina": fila.maquina, **{c: getattr(fila, c) or 0 for c in COLUMNAS_MDA}}
+        for fila in db.session.execute(stmt)
+    ]
+
+
+def detalle_maquina(db, MaquinaMesModel, MaquinaHoraModel, maquina: str, mes: str | None = None) -> dict | None:
+    """Meses de una máquina y su distribución por hora (de todos los meses o solo `mes`)."""
+    meses = db.session.execute(
+        select(MaquinaMesModel)
+        .where(MaquinaMesModel.maquina == maquina)
+        .order_by(MaquinaMesModel.mes)
+    ).scalars().all()
+    if not meses:
+        return None
+
+    stmt = (
+        select(
+            MaquinaHoraModel.hora,
+            func.sum(MaquinaHoraModel.operaciones),
+            func.sum(MaquinaHoraModel.premios),
+            func.sum(MaquinaHoraModel.monto),
+        )
+        .where(MaquinaHoraModel.maquina == maquina)
+        .group_by(MaquinaHoraModel.hora)
+    )
+    if mes:
+        stmt = stmt.where(MaquinaHoraModel.mes == mes)
+    por_hora = {h: (ops, premios, monto) for h, ops, premios, monto in db.session.execute(stmt)}
+
+    return {
+        "maquina": maquina,
+        "meses": [
+            {"mes": m.mes, "periodo": _formatear_periodo(m.mes), **{c: getattr(m, c) for c in COLUMNAS_MDA}}
+            for m in meses
+        ],
+        "horas": {
+            "labels": [str(h) for h in ORDEN_HORAS],
+            "ops": [int(por_hora.get(h, (0, 0, 0))[0] or 0) for h in ORDEN_HORAS],
+            "premios": [int(por_hora.get(h, (0, 0, 0))[1] or 0) for h in ORDEN_HORAS],
+            "monto": [float(por_hora.get(h, (0, 0, 0))[2] or 0) for h in ORDEN_HORAS],
+        },
+    }
@@ -1,4 +1,6 @@
+import datetime
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from openpyxl.utils import get_column_letter
 
@@ -8,6 +10,15 @@ HORAS_VALIDAS = set(ORDEN_HORAS)
 COLUMNAS_CLAVE_STD = {"Jornada", "Fecha", "Monto"}
 COLUMNAS_CLAVE_PREMIOS = {"Monto Transferido", "Slot Attendant", "Transferencia Final"}
 
+# Formatos que vienen en los Excel de SGOS, en orden de preferencia (día primero)
+FORMATOS_FECHA = [
+    "%d-%m-%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y %H:%M", "%d/%m/%Y %H:%M",
+    "%d-%m-%Y", "%d/%m/%Y",
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d",
+]
+MUESTRA_FORMATO = 200
+EXCEL_ORIGEN = "1899-12-30"  # Día 0 de los números de serie de Excel
+
 MESES_ES = {
     1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril", 5: "Mayo", 6: "Junio",
     7: "Julio", 8: "Agosto", 9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
@@ -48,6 +59,69 @@ def _detectar_fila_header(path_xlsx: str, sheet_name: str):
             return i
     return 0  # fallback
 
+def _detectar_formato(textos: pd.Series) -> str | None:
+    """Elige el formato de FORMATOS_FECHA que parsea más valores de una muestra repartida en la columna."""
+    paso = max(1, len(textos) // MUESTRA_FORMATO)
+    muestra = textos.iloc[::paso].head(MUESTRA_FORMATO)
+    mejor, mejor_ok = None, 0
+    for fmt in FORMATOS_FECHA:
+        ok = pd.to_datetime(muestra, format=fmt, errors="coerce").notna().sum()
+        if ok > mejor_ok:
+            mejor, mejor_ok = fmt, ok
+        if ok == len(muestra):
+            break
+    return mejor
+
+def _parsear_fechas(df: pd.DataFrame, columna: str) -> tuple[pd.Series, int]:
+    """
+    Convierte una columna de fechas del Excel a datetime64.
+    - datetime nativos (celdas de fecha): directo
+    - números: seriales de Excel
+    - texto: formato detectado en una muestra, vectorizado
+    Solo el texto que no calza con ese formato cae al parseo 'mixed' (dateutil, lento).
+    Devuelve (fechas, cantidad de filas que necesitaron el fallback).
+    """
+    resultado = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    if columna not in df.columns:
+        return resultado, 0
+
+    serie = df[columna]
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, 0
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return pd.to_datetime(serie, unit="D", origin=EXCEL_ORIGEN, errors="coerce"), 0
+
+    tipos = serie.map(type)
+    es_fecha = tipos.isin([datetime.datetime, pd.Timestamp, datetime.date])
+    es_numero = tipos.isin([int, float]) & serie.notna()
+    es_texto = tipos == str
+
+    if es_fecha.any():
+        resultado[es_fecha] = pd.to_datetime(serie[es_fecha].tolist(), errors="coerce")
+    if es_numero.any():
+        resultado[es_numero] = pd.to_datetime(
+            serie[es_numero].astype(float), unit="D", origin=EXCEL_ORIGEN, errors="coerce"
+        )
+
+    textos = serie[es_texto].str.strip()
+    textos = textos[textos != ""]
+    pendientes = textos
+    if len(textos):
+        fmt = _detectar_formato(textos)
+        if fmt:
+            rapidas = pd.to_datetime(textos, format=fmt, errors="coerce")
+            resultado[rapidas.index] = rapidas
+            pendientes = textos[rapidas.isna()]
+
+    # Cualquier otro tipo (p.ej. objetos raros de openpyxl) también va al fallback
+    otros = serie[~(es_fecha | es_numero | es_texto) & serie.notna()]
+    pendientes = pd.concat([pendientes, otros])
+    if len(pendientes):
+        resultado[pendientes.index] = pd.to_datetime(
+            pendientes, errors="coerce", dayfirst=True, format="mixed"
+        )
+    return resultado, len(pendientes)
+
 def _cargar_df(path_xlsx: str, sheet_name: str | None = None) -> pd.DataFrame:
     # Si no pasan hoja, usa la primera
     if sheet_name is None:
@@ -56,6 +130,7 @@ def _cargar_df(path_xlsx: str, sheet_name: str | None = None) -> pd.DataFrame:
     header_row = _detectar_fila_header(path_xlsx, sheet_name)
 
     df = pd.read_excel(path_xlsx, sheet_name=sheet_name, engine="openpyxl", header=header_row)
+    filas_fallback = 0  # Filas de fecha que no calzaron con el formato detectado
 
     # --- Lógica para PREMIOS ---
     if "Transferencia Final" in df.columns and "Slot Attendant" in df.columns:
@@ -65,16 +140,20 @@ def _cargar_df(path_xlsx: str, sheet_name: str | None = None) -> pd.DataFrame:
         
         # Si no existe 'Jornada', la calculamos (Fecha - 10h para ajustar día operativo)
         if "Jornada" not in df.columns:
-            # Convertimos temporalmente para calcular
-            fechas_dt = pd.to_datetime(df["Fecha"], dayfirst=True, errors='coerce')
+            # Parseamos Fecha una sola vez; abajo ya llega como datetime y no se reprocesa
+            df["Fecha"], n = _parsear_fechas(df, "Fecha")
+            filas_fallback += n
             # Asumimos inicio de jornada a las 10:00 AM (restamos 10h)
-            df["Jornada"] = (fechas_dt - pd.Timedelta(hours=10)).dt.normalize()
+            df["Jornada"] = (df["Fecha"] - pd.Timedelta(hours=10)).dt.normalize()
 
         df = df.rename(columns={
             "Cliente": "IdCliente",
             "Transferencia Final": "Monto",
             "Tipo de Pago": "FormaPago"
         })
+        # Algunos exportes traen la columna con tilde; los reportes y la BD usan 'Maquina'
+        if "Máquina" in df.columns and "Maquina" not in df.columns:
+            df = df.rename(columns={"Máquina": "Maquina"})
         df["Tipo"] = "PREMIOS"
     else:
         df["Tipo"] = "GETNET"
@@ -87,9 +166,10 @@ def _cargar_df(path_xlsx: str, sheet_name: str | None = None) -> pd.DataFrame:
         "Ingreso CAWA": "Ingreso",
     })
 
-    # Usar format='mixed' para soportar tanto DD-MM-YYYY como YYYY-MM-DD correctamente
-    df["Fecha"] = pd.to_datetime(df.get("Fecha"), errors="coerce", dayfirst=True, format="mixed")
-    df["Jornada"] = pd.to_datetime(df.get("Jornada"), errors="coerce", dayfirst=True, format="mixed")
+    # Formato explícito detectado por columna; 'mixed' solo para las filas que no calzan
+    for col in ("Fecha", "Jornada"):
+        df[col], n = _parsear_fechas(df, col)
+        filas_fallback += n
     df["Monto"] = pd.to_numeric(df.get("Monto"), errors="coerce").fillna(0)
 
     df = df.dropna(subset=["Fecha", "Jornada", "Attendant"]).copy()
@@ -101,11 +181,232 @@ def _cargar_df(path_xlsx: str, sheet_name: str | None = None) -> pd.DataFrame:
     df = df[df["Hora"].isin(HORAS_VALIDAS)].copy()
 
     df["Mes"] = df["JornadaDia"].dt.to_period("M").astype(str)
+    df.attrs["filas_fecha_fallback"] = filas_fallback
     return df
 
-def guardar_datos_db(path_xlsx: str, db, OperacionModel, PremioModel, sheet_name: str | None = None):
+def incrementar_version(db, VersionModel, tipo: str):
+    """
+    Sube en 1 la versión de datos de `tipo` (GETNET / PREMIOS) dentro de la
+    transacción actual. El UPDATE es atómico en la BD, así que dos ingestas
+    simultáneas nunca terminan con la misma versión.
+    """
+    actualizados = (
+        db.session.query(VersionModel)
+          .filter(VersionModel.tipo == tipo)
+          .update({VersionModel.version: VersionModel.version + 1}, synchronize_session=False)
+    )
+    if not actualizados:
+        db.session.add(VersionModel(tipo=tipo, version=1))
+
+def _clasificar_pago(val):
+    """Categoría de un pago de Premios según su FormaPago normalizada (minúsculas, sin espacios extremos)."""
+    if val in ["jackpot hp", "progresive jackpot hp", "progressive jackpot hp"]:
+        return "Premios"
+    elif val == "mdc purse clear":
+        return "MDC purse clear"
+    elif val == "cancel credit":
+        return "Cancel Credit"
+    elif val == "chip cash handpay":
+        return "Chip Cash HandPay"
+    return None
+
+def _valor_maquina(row) -> str:
+    # Mismo valor que se guarda en premios.maquina
+    return str(row.get("Máquina", "") or row.get("Maquina", ""))
+
+def actualizar_indice_maquinas(db, df: pd.DataFrame, meses, MaquinaMesModel, MaquinaHoraModel):
+    """
+    Reemplaza en el índice por máquina (MDA) los `meses` con lo que trae df
+    (Premios): conteo por categoría y monto de premios por máquina y mes, y
+    distribución por hora. Corre dentro de la transacción de quien llama.
+    """
+    meses = [str(m) for m in meses]
+    for Model in (MaquinaMesModel, MaquinaHoraModel):
+        db.session.query(Model).filter(Model.mes.in_(meses)).delete(synchronize_session=False)
+    if df.empty:
+        return
+
+    d = pd.DataFrame({
+        "maquina": [_valor_maquina(r) for r in df.to_dict("records")],
+        "mes": df["Mes"].astype(str).values,
+        "hora": df["Hora"].astype(int).values,
+        "monto": df["Monto"].astype(float).values,
+    })
+    forma_pago = df["FormaPago"] if "FormaPago" in df.columns else pd.Series("", index=df.index)
+    d["categoria"] = forma_pago.astype(str).str.lower().str.strip().map(_clasificar_pago).values
+    d["es_premio"] = d["categoria"] == "Premios"
+    d["monto_premios"] = d["monto"].where(d["es_premio"], 0.0)
+
+    por_mes = d.groupby(["maquina", "mes"]).agg(
+        operaciones=("monto", "size"), monto=("monto_premios", "sum")
+    )
+    conteos = (
+        d[d["categoria"].notna()]
+          .groupby(["maquina", "mes", "categoria"]).size()
+          .unstack("categoria")
+    )
+    por_mes = por_mes.join(conteos).fillna(0).reset_index()
+    for col in ["Premios", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]:
+        if col not in por_mes.columns:
+            por_mes[col] = 0
+
+    por_hora = (
+        d.groupby(["maquina", "mes", "hora"])
+          .agg(operaciones=("monto", "size"), premios=("es_premio", "sum"), monto=("monto_premios", "sum"))
+          .reset_index()
+    )
+
+    db.session.add_all([
+        MaquinaMesModel(
+            maquina=f["maquina"], mes=f["mes"],
+            operaciones=int(f["operaciones"]),
+            premios=int(f["Premios"]),
+            monto=float(f["monto"]),
+            mdc_purse_clear=int(f["MDC purse clear"]),
+            cancel_credit=int(f["Cancel Credit"]),
+            chip_cash_handpay=int(f["Chip Cash HandPay"]),
+        )
+        for f in por_mes.to_dict("records")
+    ])
+    db.session.add_all([
+        MaquinaHoraModel(
+            maquina=f["maquina"], mes=f["mes"], hora=int(f["hora"]),
+            operaciones=int(f["operaciones"]), premios=int(f["premios"]), monto=float(f["monto"]),
+        )
+        for f in por_hora.to_dict("records")
+    ])
+
+def _recalcular_records(db, tipo: str, IndiceModel, RecordModel):
+    """
+    Recalcula los récords por asistente de `tipo` leyendo solo el índice
+    diario (una fila por asistente y jornada), nunca las filas crudas.
+    """
+    from sqlalchemy import select
+
+    indice = pd.read_sql(
+        select(IndiceModel.attendant, IndiceModel.jornada_dia, IndiceModel.mes, IndiceModel.operaciones)
+        .where(IndiceModel.tipo == tipo),
+        db.session.connection()
+    )
+    db.session.query(RecordModel).filter(RecordModel.tipo == tipo).delete(synchronize_session=False)
+    if indice.empty:
+        return
+
+    # Mismo desempate que generar_reportes: ante igualdad gana la primera jornada
+    indice["jornada_dia"] = pd.to_datetime(indice["jornada_dia"])
+    indice = indice.sort_values(["attendant", "jornada_dia"], kind="stable").reset_index(drop=True)
+    mejor_dia = indice.loc[indice.groupby("attendant")["operaciones"].idxmax()].set_index("attendant")
+
+    por_mes = indice.groupby(["attendant", "mes"], as_index=False)["operaciones"].sum()
+    mejor_mes = por_mes.loc[por_mes.groupby("attendant")["operaciones"].idxmax()].set_index("attendant")
+
+    # Ventanas móviles hacia atrás desde la última jornada cargada
+    referencia = indice["jornada_dia"].max()
+
+    def ventana(dias):
+        desde = referencia - pd.Timedelta(days=dias - 1)
+        return indice[indice["jornada_dia"] >= desde].groupby("attendant")["operaciones"].sum()
+
+    ops_7d, ops_30d = ventana(7), ventana(30)
+    total = indice.groupby("attendant")["operaciones"].sum()
+
+    db.session.add_all([
+        RecordModel(
+            tipo=tipo,
+            attendant=asistente,
+            mejor_jornada=mejor_dia.at[asistente, "jornada_dia"].date(),
+            ops_mejor_jornada=int(mejor_dia.at[asistente, "operaciones"]),
+            mejor_mes=mejor_mes.at[asistente, "mes"],
+            ops_mejor_mes=int(mejor_mes.at[asistente, "operaciones"]),
+            ops_7d=int(ops_7d.get(asistente, 0)),
+            ops_30d=int(ops_30d.get(asistente, 0)),
+            total_operaciones=int(total[asistente]),
+            referencia=referencia.date(),
+        )
+        for asistente in total.index
+    ])
+
+def actualizar_indice_asistentes(db, df: pd.DataFrame, tipo: str, meses, IndiceModel, RecordModel):
+    """
+    Reemplaza en el índice por asistente/jornada los `meses` de `tipo` con lo
+    que trae df, y recalcula los récords. Corre dentro de la transacción de
+    quien llama (guardar_datos_db o `flask reindexar`).
+    """
+    (
+        db.session.query(IndiceModel)
+          .filter(IndiceModel.tipo == tipo, IndiceModel.mes.in_([str(m) for m in meses]))
+          .delete(synchronize_session=False)
+    )
+
+    diario = (
+        df.groupby(["Attendant", "JornadaDia", "Mes"], as_index=False)
+          .agg(Operaciones=("Monto", "size"), Monto=("Monto", "sum"))
+    )
+    db.session.add_all([
+        IndiceModel(
+            tipo=tipo,
+            attendant=fila.Attendant,
+            jornada_dia=fila.JornadaDia.date(),
+            mes=fila.Mes,
+            operaciones=int(fila.Operaciones),
+            monto=float(fila.Monto),
+        )
+        for fila in diario.itertuples(index=False)
+    ])
+    db.session.flush()
+    _recalcular_records(db, tipo, IndiceModel, RecordModel)
+
+def record_desde_indice(filas) -> pd.DataFrame:
+    """
+    Arma la entrada de "Record Asistentes" (Attendant, JornadaDia,
+    TotalOperaciones) desde filas de RecordAsistente, en el mismo orden en
+    que la deja el groupby de generar_reportes.
+    """
+    ops_record = pd.DataFrame(
+        [(f.attendant, f.mejor_jornada, f.ops_mejor_jornada) for f in filas],
+        columns=["Attendant", "JornadaDia", "TotalOperaciones"]
+    )
+    ops_record["JornadaDia"] = pd.to_datetime(ops_record["JornadaDia"])
+    ops_record["TotalOperaciones"] = ops_record["TotalOperaciones"].astype("int64")
+    return ops_record.sort_values("Attendant", kind="stable").reset_index(drop=True)
+
+def registrar_archivo(db, ArchivoModel, archivo_info: dict, tipo: str, meses, registros: int):
+    """
+    Registra el hash del archivo recién ingerido. Como cada ingesta reemplaza
+    sus meses completos, los registros previos del mismo tipo que compartan
+    algún mes dejan de representar lo que hay en la BD y se marcan como no
+    vigentes: volver a subir uno de esos archivos se procesa de nuevo. No se
+    borran porque el barrido de uploads los usa para saber qué compactar.
+    """
+    meses = sorted(str(m) for m in meses)
+    for previo in db.session.query(ArchivoModel).filter(ArchivoModel.tipo == tipo).all():
+        if set(previo.meses.split(",")) & set(meses):
+            previo.vigente = False
+
+    # Si el mismo contenido ya estuvo (y quedó reemplazado), se reusa su fila
+    registro = db.session.get(ArchivoModel, archivo_info["sha256"])
+    if registro is None:
+        registro = ArchivoModel(sha256=archivo_info["sha256"])
+        db.session.add(registro)
+    registro.archivo = archivo_info["archivo"]
+    registro.nombre_original = archivo_info.get("nombre_original")
+    registro.tipo = tipo
+    registro.meses = ",".join(meses)
+    registro.registros = registros
+    registro.creado = datetime.datetime.now()
+    registro.vigente = True
+
+def guardar_datos_db(path_xlsx: str, db, OperacionModel, PremioModel, sheet_name: str | None = None,
+                     VersionModel=None, IndiceModel=None, RecordModel=None,
+                     MaquinaMesModel=None, MaquinaHoraModel=None,
+                     ArchivoModel=None, archivo_info: dict | None = None):
     """
     Lee el Excel, detecta si es Getnet o Premios, y guarda en la tabla correspondiente.
+    Si se pasa VersionModel, incrementa la versión de datos de ese tipo en la misma transacción.
+    Si se pasan IndiceModel/RecordModel, actualiza el índice por asistente de los meses cargados.
+    Si se pasan MaquinaMesModel/MaquinaHoraModel y el archivo es de Premios, actualiza el índice por máquina.
+    Si se pasan ArchivoModel y archivo_info (sha256, archivo, nombre_original), registra el archivo
+    como ingerido (ver registrar_archivo).
     """
     df = _cargar_df(path_xlsx, sheet_name=sheet_name)
     
@@ -140,7 +441,7 @@ def guardar_datos_db(path_xlsx: str, db, OperacionModel, PremioModel, sheet_name
                     id_cliente=str(row.get("IdCliente", "")),
                     monto=row["Monto"],
                     propina=row.get("Propina", 0),
-                    maquina=str(row.get("Máquina", "") or row.get("Maquina", "")),
+                    maquina=_valor_maquina(row),
                     attendant=row["Attendant"],
                     validador=str(row.get("Validador", "")),
                     forma_pago=str(row.get("FormaPago", "")),
@@ -165,29 +466,111 @@ def guardar_datos_db(path_xlsx: str, db, OperacionModel, PremioModel, sheet_name
             registros.append(reg)
         
         db.session.add_all(registros)
+        if IndiceModel is not None and RecordModel is not None:
+            actualizar_indice_asistentes(db, df, tipo_archivo, meses_en_archivo, IndiceModel, RecordModel)
+        if tipo_archivo == "PREMIOS" and MaquinaMesModel is not None and MaquinaHoraModel is not None:
+            actualizar_indice_maquinas(db, df, meses_en_archivo, MaquinaMesModel, MaquinaHoraModel)
+        if ArchivoModel is not None and archivo_info:
+            registrar_archivo(db, ArchivoModel, archivo_info, tipo_archivo, meses_en_archivo, len(registros))
+        if VersionModel is not None:
+            incrementar_version(db, VersionModel, tipo_archivo)
         db.session.commit()
         return len(registros), tipo_archivo
     except Exception as e:
         db.session.rollback()
         raise e
 
-def generar_reportes(df: pd.DataFrame, asistentes_filtro: list = None) -> dict:
+COLUMNAS_CATEGORIA = ["Premios", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]
+
+
+def _sin_arrow(tabla: pd.DataFrame) -> pd.DataFrame:
     """
-    Genera los diccionarios de DataFrames (tablas) a partir de un DataFrame principal ya limpio.
+    Pasa a los dtypes de numpy las columnas respaldadas por Arrow (el histórico
+    llega así desde el snapshot, ver app._leer_tabla). Solo se aplica a los
+    agregados, que son chicos: los reportes salen iguales venga de donde venga.
     """
-    if asistentes_filtro:
-        df = df[df["Attendant"].isin(asistentes_filtro)].copy()
+    for col, dtype in tabla.dtypes.items():
+        if isinstance(dtype, pd.ArrowDtype):
+            tabla[col] = tabla[col].astype(dtype.numpy_dtype)
+    return tabla
 
-    tabla_mes = (
-        df.groupby("Mes", as_index=False)
-          .agg(Operaciones=("Monto", "count"), Monto=("Monto", "sum"))
-          .sort_values("Mes")
+
+def _agregados(df: pd.DataFrame, con_categorias: bool, con_jornadas: bool) -> dict:
+    """
+    Los GROUP BY de generar_reportes sobre las filas ya filtradas. Cada tabla
+    sale ordenada por sus claves, tal como la deja groupby; motor_duckdb
+    entrega exactamente lo mismo desde SQL y _armar_reportes arma con esto las
+    tablas finales en ambos casos.
+    Los conteos por categoría de Premios van en formato largo (claves,
+    Categoria, n) y se pivotean al armar.
+    """
+    ag = {
+        "mes": df.groupby("Mes", as_index=False).agg(Operaciones=("Monto", "count"), Monto=("Monto", "sum")),
+        "hora": df.groupby("Hora", as_index=False).agg(Operaciones=("Monto", "count"), Monto=("Monto", "sum")),
+        "asistente_mes": (
+            df.groupby(["Attendant", "Mes"], as_index=False)
+              .agg(Operaciones=("Monto", "count"), Monto=("Monto", "sum"))
+        ),
+        "qa": {
+            "filas": len(df),
+            "min_fecha": pd.Timestamp(df["Fecha"].min()),  # NaT (no <NA>) también con columnas Arrow vacías
+            "max_fecha": pd.Timestamp(df["Fecha"].max()),
+            "horas": sorted(df["Hora"].unique()),
+        },
+    }
+    if con_jornadas:
+        ag["jornadas"] = (
+            df.groupby(["Attendant", "JornadaDia"], as_index=False)
+              .size()
+              .rename(columns={"size": "TotalOperaciones"})
+        )
+
+    if con_categorias:
+        # Normalizar y clasificar cada FormaPago distinta una sola vez
+        forma_norm = df["FormaPago"].astype(str).str.lower().str.strip()
+        categoria = forma_norm.map({v: _clasificar_pago(v) for v in forma_norm.unique()})
+        df_p = df.assign(Categoria=categoria, MontoPremios=df["Monto"].where(categoria == "Premios", 0))
+        df_c = df_p[df_p["Categoria"].notna()]
+
+        def _largo(claves):
+            return df_c.groupby(claves + ["Categoria"], as_index=False).agg(n=("Monto", "count"))
+
+        ag["categorias_mes_asistente"] = _largo(["Mes", "Attendant"])
+        ag["categorias_asistente"] = _largo(["Attendant"])
+        ag["categorias_mes_maquina"] = _largo(["Mes", "Maquina"])
+        ag["categorias_maquina"] = _largo(["Maquina"])
+        ag["monto_mes_maquina"] = df_p.groupby(["Mes", "Maquina"], as_index=False)["MontoPremios"].sum()
+        ag["monto_maquina"] = df_p.groupby(["Maquina"], as_index=False)["MontoPremios"].sum()
+    else:
+        ag["mes_asistente"] = df.groupby(["Mes", "Attendant"], as_index=False).agg(Operaciones=("Monto", "count"))
+        ag["asistente"] = df.groupby(["Attendant"], as_index=False).agg(Operaciones=("Monto", "count"))
+    return {k: _sin_arrow(v) if isinstance(v, pd.DataFrame) else v for k, v in ag.items()}
+
+
+def _pivotar_categorias(largo: pd.DataFrame, claves: list) -> pd.DataFrame:
+    """Conteos (claves, Categoria, n) a una columna por categoría, con 0 donde no hay."""
+    tabla = (
+        largo.pivot(index=claves, columns="Categoria", values="n")
+             .fillna(0)
+             .astype("int64")
+             .reset_index()
     )
+    for col in COLUMNAS_CATEGORIA:
+        if col not in tabla.columns:
+            tabla[col] = 0
+    tabla = tabla[claves + COLUMNAS_CATEGORIA]
+    tabla.columns.name = None
+    return tabla
+
+
+def _armar_reportes(ag: dict, es_premios: bool, ops_record: pd.DataFrame = None,
+                    tipo_jornada="datetime64[ns]", filas_fecha_fallback: int | None = None) -> dict:
+    """Tablas finales (orden, formato de periodos, columnas) a partir de _agregados."""
+    tabla_mes = ag["mes"].sort_values("Mes")
     tabla_mes["Mes"] = tabla_mes["Mes"].apply(_formatear_periodo)
 
     tabla_hora = (
-        df.groupby("Hora", as_index=False)
-          .agg(Operaciones=("Monto", "count"), Monto=("Monto", "sum"))
+        ag["hora"]
         .set_index("Hora")
         .reindex(ORDEN_HORAS, fill_value=0)
         .reset_index()
@@ -195,212 +578,87 @@ def generar_reportes(df: pd.DataFrame, asistentes_filtro: list = None) -> dict:
     # Convertir a string para que Excel lo trate como categorías (texto) y no números
     tabla_hora["Hora"] = tabla_hora["Hora"].astype(str)
 
-    ops_por_jornada = (
-        df.groupby(["Attendant", "JornadaDia"], as_index=False)
-          .size()
-          .rename(columns={"size": "TotalOperaciones"})
-    )
-
-    if len(ops_por_jornada) > 0:
-        idx_max = ops_por_jornada.groupby("Attendant")["TotalOperaciones"].idxmax()
+    if ops_record is not None:
+        # Misma resolución de fecha que el df (ns/us según la versión de pandas)
+        ops_record = ops_record.astype({"JornadaDia": tipo_jornada})
         tabla_record = (
-            ops_por_jornada.loc[idx_max]
-              .sort_values("TotalOperaciones", ascending=False)
+            ops_record.sort_values("TotalOperaciones", ascending=False)
               .reset_index(drop=True)
         )
     else:
-        tabla_record = ops_por_jornada
-
-    # Configurar agregación: si es Premios, NO mostramos Monto
-    es_premios = False
-    if not df.empty and "Tipo" in df.columns:
-        es_premios = (df["Tipo"].iloc[0] == "PREMIOS")
-
-    agg_config = {"Operaciones": ("Monto", "count")}
-    if not es_premios:
-        agg_config["Monto"] = ("Monto", "sum")
-
-    tabla_asistente_mes = (
-        df.groupby(["Attendant", "Mes"], as_index=False)
-          .agg(**agg_config)
-          .sort_values(["Mes", "Operaciones"], ascending=[True, False])
-    )
+        ops_por_jornada = ag["jornadas"]
+        if len(ops_por_jornada) > 0:
+            idx_max = ops_por_jornada.groupby("Attendant")["TotalOperaciones"].idxmax()
+            tabla_record = (
+                ops_por_jornada.loc[idx_max]
+                  .sort_values("TotalOperaciones", ascending=False)
+                  .reset_index(drop=True)
+            )
+        else:
+            tabla_record = ops_por_jornada
+
+    # Si es Premios, NO mostramos Monto
+    tabla_asistente_mes = ag["asistente_mes"]
+    if es_premios:
+        tabla_asistente_mes = tabla_asistente_mes.drop(columns="Monto")
+    tabla_asistente_mes = tabla_asistente_mes.sort_values(["Mes", "Operaciones"], ascending=[True, False])
     tabla_asistente_mes["Mes"] = tabla_asistente_mes["Mes"].apply(_formatear_periodo)
 
-    # Para Conteo Operaciones:
-    if es_premios and "FormaPago" in df.columns:
-        # Crear copia para no afectar el df original y normalizar
-        df_p = df.copy()
-        df_p['FormaPagoNorm'] = df_p['FormaPago'].astype(str).str.lower().str.strip()
-        
-        def classify_payment(val):
-            if val in ["jackpot hp", "progresive jackpot hp", "progressive jackpot hp"]:
-                return "Premios"
-            elif val == "mdc purse clear":
-                return "MDC purse clear"
-            elif val == "cancel credit":
-                return "Cancel Credit"
-            elif val == "chip cash handpay":
-                return "Chip Cash HandPay"
-            return None
-
-        df_p['Categoria'] = df_p['FormaPagoNorm'].apply(classify_payment)
-        
-        # Pivot table para contar por categoría
-        # Usamos 'Monto' como columna dummy para contar (count)
-        tabla_conteo_ops = pd.pivot_table(
-            df_p[df_p['Categoria'].notna()],
-            index=["Mes", "Attendant"],
-            columns="Categoria",
-            values="Monto", 
-            aggfunc="count",
-            fill_value=0
-        ).reset_index()
-        
-        # Asegurar que existan todas las columnas deseadas (rellenar con 0 si no hay datos)
-        cols_deseadas = ["Premios", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]
-        for col in cols_deseadas:
-            if col not in tabla_conteo_ops.columns:
-                tabla_conteo_ops[col] = 0
-        
-        # Ordenar columnas: Mes, Attendant, y luego las categorías en el orden pedido
-        tabla_conteo_ops = tabla_conteo_ops[["Mes", "Attendant"] + cols_deseadas]
-        
-        # Ordenar filas: por Mes y luego por cantidad de Premios (descendente)
+    if "categorias_asistente" in ag:
+        # Conteo por categoría, por mes y asistente; filas por Mes y luego Premios (descendente)
+        tabla_conteo_ops = _pivotar_categorias(ag["categorias_mes_asistente"], ["Mes", "Attendant"])
         tabla_conteo_ops = tabla_conteo_ops.sort_values(["Mes", "Premios"], ascending=[True, False])
-        
-        # Eliminar nombre del índice de columnas para limpieza
-        tabla_conteo_ops.columns.name = None
-
-        # --- NUEVA TABLA: Total de conteo anual por asistente (Detallado) ---
-        tabla_conteo_anual = pd.pivot_table(
-            df_p[df_p['Categoria'].notna()],
-            index=["Attendant"],
-            columns="Categoria",
-            values="Monto", 
-            aggfunc="count",
-            fill_value=0
-        ).reset_index()
-        
-        for col in cols_deseadas:
-            if col not in tabla_conteo_anual.columns:
-                tabla_conteo_anual[col] = 0
-                
-        tabla_conteo_anual = tabla_conteo_anual[["Attendant"] + cols_deseadas]
+
+        # Total de conteo anual por asistente (Detallado)
+        tabla_conteo_anual = _pivotar_categorias(ag["categorias_asistente"], ["Attendant"])
         tabla_conteo_anual = tabla_conteo_anual.sort_values(["Premios"], ascending=False)
-        tabla_conteo_anual.columns.name = None
 
-        # --- NUEVA TABLA: Conteo Total Anual (Simple) ---
+        # Conteo Total Anual (Simple): todas las categorías juntas
         tabla_conteo_anual_total = (
-            df_p[df_p['Categoria'].notna()]
+            ag["categorias_asistente"]
             .groupby("Attendant", as_index=False)
-            .agg(Operaciones=("Monto", "count"))
+            .agg(Operaciones=("n", "sum"))
             .sort_values("Operaciones", ascending=False)
         )
 
-        # --- NUEVA TABLA: Conteo de operaciones por MDA ---
+        # Conteo de operaciones por MDA
         # Mes | Maquina | cantidad de premios (jackpot + progresive) | monto | cantidad de MDC Purse Clear | Cancel credit | Chip Cash HandPay
-        
-        # Usamos el mismo df_p que ya tiene 'Categoria' y 'FormaPagoNorm'
-        # Pero necesitamos calcular Monto SOLO para Premios.
-        # Creamos columna auxiliar MontoPremios
-        df_p["MontoPremios"] = df_p.apply(lambda x: x["Monto"] if x["Categoria"] == "Premios" else 0, axis=1)
-        
-        # Agrupamos por Mes y Maquina
-        # Calculamos conteos por categoría y suma de MontoPremios
-        
-        # Pivot para conteos
-        pivot_counts = pd.pivot_table(
-            df_p[df_p['Categoria'].notna()],
-            index=["Mes", "Maquina"],
-            columns="Categoria",
-            values="Monto", # Dummy para count
-            aggfunc="count",
-            fill_value=0
-        ).reset_index()
-        
-        # Suma de montos de premios
-        monto_premios = df_p.groupby(["Mes", "Maquina"])["MontoPremios"].sum().reset_index()
-        
-        # Merge
-        tabla_conteo_mda = pd.merge(pivot_counts, monto_premios, on=["Mes", "Maquina"], how="left")
-        
-        # Asegurar columnas
-        for col in cols_deseadas:
-            if col not in tabla_conteo_mda.columns:
-                tabla_conteo_mda[col] = 0
-                
-        # Renombrar y ordenar
-        # Queremos: Mes, Maquina, Premios, Monto (de premios), MDC, Cancel, Chip
-        tabla_conteo_mda = tabla_conteo_mda.rename(columns={"MontoPremios": "Monto"})
-        
-        cols_finales_mda = ["Mes", "Maquina", "Premios", "Monto", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]
-        tabla_conteo_mda = tabla_conteo_mda[cols_finales_mda]
-        
-        # Ordenar
+        # El monto es solo el de la categoría Premios
+        tabla_conteo_mda = pd.merge(
+            _pivotar_categorias(ag["categorias_mes_maquina"], ["Mes", "Maquina"]),
+            ag["monto_mes_maquina"], on=["Mes", "Maquina"], how="left",
+        ).rename(columns={"MontoPremios": "Monto"})
+        tabla_conteo_mda = tabla_conteo_mda[["Mes", "Maquina", "Premios", "Monto", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]]
         tabla_conteo_mda = tabla_conteo_mda.sort_values(["Mes", "Premios"], ascending=[True, False])
         tabla_conteo_mda["Mes"] = tabla_conteo_mda["Mes"].apply(_formatear_periodo)
-        tabla_conteo_mda.columns.name = None
 
-        # --- NUEVA TABLA: Conteo total de operaciones por MDA (Acumulado) ---
-        # Maquina | cantidad de premios (jackpot + progresive) | monto | cantidad de MDC Purse Clear | Cancel credit | Chip Cash HandPay
-        
-        # Pivot para conteos totales (sin agrupar por Mes)
-        pivot_counts_total = pd.pivot_table(
-            df_p[df_p['Categoria'].notna()],
-            index=["Maquina"],
-            columns="Categoria",
-            values="Monto", 
-            aggfunc="count",
-            fill_value=0
-        ).reset_index()
-        
-        # Suma de montos de premios totales
-        monto_premios_total = df_p.groupby(["Maquina"])["MontoPremios"].sum().reset_index()
-        
-        # Merge total
-        tabla_conteo_mda_total = pd.merge(pivot_counts_total, monto_premios_total, on=["Maquina"], how="left")
-        
-        # Asegurar columnas
-        for col in cols_deseadas:
-            if col not in tabla_conteo_mda_total.columns:
-                tabla_conteo_mda_total[col] = 0
-                
-        # Renombrar y ordenar
-        tabla_conteo_mda_total = tabla_conteo_mda_total.rename(columns={"MontoPremios": "Monto"})
-        
-        # Columnas finales (sin Mes)
-        cols_finales_mda_total = ["Maquina", "Premios", "Monto", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]
-        tabla_conteo_mda_total = tabla_conteo_mda_total[cols_finales_mda_total]
-        
-        # Ordenar por Premios descendente
+        # Conteo total de operaciones por MDA (Acumulado, sin Mes)
+        tabla_conteo_mda_total = pd.merge(
+            _pivotar_categorias(ag["categorias_maquina"], ["Maquina"]),
+            ag["monto_maquina"], on=["Maquina"], how="left",
+        ).rename(columns={"MontoPremios": "Monto"})
+        tabla_conteo_mda_total = tabla_conteo_mda_total[["Maquina", "Premios", "Monto", "MDC purse clear", "Cancel Credit", "Chip Cash HandPay"]]
         tabla_conteo_mda_total = tabla_conteo_mda_total.sort_values(["Premios"], ascending=False)
-        tabla_conteo_mda_total.columns.name = None
 
     else:
         # Lógica original para Getnet
-        tabla_conteo_ops = (
-            df.groupby(["Mes", "Attendant"], as_index=False)
-              .agg(Operaciones=("Monto", "count"))
-              .sort_values(["Mes", "Operaciones"], ascending=[True, False])
-        )
-        tabla_conteo_anual = (
-            df.groupby(["Attendant"], as_index=False)
-              .agg(Operaciones=("Monto", "count"))
-              .sort_values(["Operaciones"], ascending=False)
-        )
+        tabla_conteo_ops = ag["mes_asistente"].sort_values(["Mes", "Operaciones"], ascending=[True, False])
+        tabla_conteo_anual = ag["asistente"].sort_values(["Operaciones"], ascending=False)
         tabla_conteo_anual_total = tabla_conteo_anual.copy()
         tabla_conteo_mda = pd.DataFrame() # Vacía para Getnet
         tabla_conteo_mda_total = pd.DataFrame() # Vacía para Getnet
-    
+
     tabla_conteo_ops["Mes"] = tabla_conteo_ops["Mes"].apply(_formatear_periodo)
 
+    qa = ag["qa"]
     qa_df = pd.DataFrame([
-        ["filas_usadas", len(df)],
-        ["min_fecha", str(df["Fecha"].min())],
-        ["max_fecha", str(df["Fecha"].max())],
-        ["horas_presentes", ", ".join(map(str, sorted(df["Hora"].unique())))],
+        ["filas_usadas", qa["filas"]],
+        ["min_fecha", str(qa["min_fecha"])],
+        ["max_fecha", str(qa["max_fecha"])],
+        ["horas_presentes", ", ".join(map(str, qa["horas"]))],
     ], columns=["Metrica", "Valor"])
+    if filas_fecha_fallback is not None:
+        qa_df.loc[len(qa_df)] = ["filas_fecha_fallback", filas_fecha_fallback]
 
     reportes = {
         "Resumen Mensual": tabla_mes,
@@ -411,22 +669,167 @@ def generar_reportes(df: pd.DataFrame, asistentes_filtro: list = None) -> dict:
         "Total de conteo anual por asistente": tabla_conteo_anual,
         "Conteo Total Anual": tabla_conteo_anual_total,
     }
-    
+
     if es_premios:
         reportes["Conteo mensual de operaciones por MDA"] = tabla_conteo_mda
         reportes["Conteo total de operaciones por MDA"] = tabla_conteo_mda_total
-        
+
     reportes["QA"] = qa_df
-    
+
     return reportes
 
+
+def generar_reportes(df: pd.DataFrame, asistentes_filtro: list = None, ops_record: pd.DataFrame = None) -> dict:
+    """
+    Genera los diccionarios de DataFrames (tablas) a partir de un DataFrame principal ya limpio.
+    ops_record: mejor jornada por asistente ya calculada (ver record_desde_indice);
+    si viene, "Record Asistentes" no se recalcula desde las filas.
+    """
+    if asistentes_filtro:
+        df = df[df["Attendant"].isin(asistentes_filtro)]
+        if ops_record is not None:
+            ops_record = ops_record[ops_record["Attendant"].isin(asistentes_filtro)]
+
+    es_premios = False
+    if not df.empty and "Tipo" in df.columns:
+        es_premios = (df["Tipo"].iloc[0] == "PREMIOS")
+
+    ag = _agregados(df, con_categorias=es_premios and "FormaPago" in df.columns, con_jornadas=ops_record is None)
+    return _armar_reportes(
+        ag, es_premios, ops_record,
+        tipo_jornada=df["JornadaDia"].dtype,
+        # Solo existe cuando el df viene de un Excel (_cargar_df)
+        filas_fecha_fallback=df.attrs.get("filas_fecha_fallback"),
+    )
+
+VENTANA_CONCILIACION_MIN = 30
+CLIENTES_VACIOS = {"", "nan", "none", "<na>"}
+
+def _normalizar_id_cliente(ids: pd.Series) -> pd.Series:
+    """
+    Texto comparable del IdCliente. Una columna numérica con celdas vacías
+    llega de Excel como float y se guarda como "1005.0"; la misma persona en el
+    otro archivo puede venir como "1005" o "01005". Los IDs puramente numéricos
+    quedan sin ".0" ni ceros a la izquierda.
+    """
+    ids = ids.astype(str).str.strip()
+    numericos = ids.str.fullmatch(r"\d+(\.0*)?")
+    ids[numericos] = ids[numericos].str.replace(r"\.0*$", "", regex=True).str.lstrip("0").replace("", "0")
+    return ids
+
+def _preparar_conciliacion(df: pd.DataFrame) -> pd.DataFrame:
+    """Deja Fecha, IdCliente y Attendant comparables entre Getnet y Premios (BD o Excel)."""
+    df = df.rename(columns={"id_cliente": "IdCliente", "voucher": "Voucher"})
+    # Solo las columnas del cruce, en numpy (el histórico puede venir del snapshot Arrow)
+    columnas = ["Fecha", "IdCliente", "Attendant", "Monto", "Mes", "Voucher", "Maquina", "FormaPago"]
+    df = _sin_arrow(df[[c for c in columnas if c in df.columns]].copy())
+    ids = _normalizar_id_cliente(df["IdCliente"])
+    df = df.assign(
+        Fecha=pd.to_datetime(df["Fecha"]).astype("datetime64[ns]"),
+        IdCliente=ids.mask(ids.str.lower().isin(CLIENTES_VACIOS), ""),  # Sin cliente: "" en ambos lados
+        Attendant=df["Attendant"].astype(str).str.strip(),
+    )
+    return df.sort_values("Fecha", kind="stable")
+
+def _conciliar_mes(mes: str, premios: pd.DataFrame, getnet: pd.DataFrame, ventana: pd.Timedelta) -> pd.DataFrame:
+    """
+    Para cada premio del mes busca la operación Getnet del mismo cliente y
+    asistente más cercana en el tiempo, dentro de ±ventana (merge_asof: ambos
+    lados ordenados por Fecha, sin producto cartesiano).
+    """
+    # Solo la franja de Getnet que puede calzar con este mes
+    fechas = getnet["Fecha"].values
+    desde = fechas.searchsorted((premios["Fecha"].min() - ventana).to_datetime64(), side="left")
+    hasta = fechas.searchsorted((premios["Fecha"].max() + ventana).to_datetime64(), side="right")
+    g = getnet.iloc[desde:hasta]
+
+    cols_g = ["Fecha", "IdCliente", "Attendant", "Monto"] + (["Voucher"] if "Voucher" in g.columns else [])
+    g = g[cols_g].rename(columns={"Monto": "MontoGetnet", "Voucher": "VoucherGetnet"})
+    g["FechaGetnet"] = g["Fecha"]
+
+    cols_p = ["Fecha", "IdCliente", "Attendant", "Monto"] + [c for c in ("Maquina", "FormaPago") if c in premios.columns]
+    cruce = pd.merge_asof(
+        premios[cols_p].rename(columns={"Monto": "MontoPremio"}),
+        g,
+        on="Fecha",
+        by=["IdCliente", "Attendant"],
+        direction="nearest",
+        tolerance=ventana,
+    )
+    cruce = cruce.rename(columns={"Fecha": "FechaPremio"})
+    cruce.insert(0, "Mes", mes)
+    cruce["DiferenciaMin"] = ((cruce["FechaGetnet"] - cruce["FechaPremio"]).dt.total_seconds() / 60).round(1)
+    cruce["Estado"] = (
+        cruce["FechaGetnet"].notna().map({True: "Conciliado", False: "Sin Getnet"})
+          .where(cruce["IdCliente"] != "", "Sin cliente")
+    )
+    return cruce
+
+def conciliar_getnet_premios(df_getnet: pd.DataFrame, df_premios: pd.DataFrame,
+                             ventana_min: int = VENTANA_CONCILIACION_MIN,
+                             meses: list | None = None, max_workers: int | None = None) -> dict:
+    """
+    Reporte de conciliación Premios -> Getnet por cliente, asistente y ventana de tiempo.
+    Procesa cada mes de Premios en paralelo. Devuelve tablas listas para exportar_excel_bytes.
+    """
+    ventana = pd.Timedelta(minutes=ventana_min)
+    premios = _preparar_conciliacion(df_premios) if not df_premios.empty else df_premios
+    getnet = _preparar_conciliacion(df_getnet) if not df_getnet.empty else df_getnet
+    # Una operación Getnet sin cliente no puede respaldar ningún premio; los
+    # premios sin cliente sí quedan, con Estado "Sin cliente"
+    if not getnet.empty:
+        getnet = getnet[getnet["IdCliente"] != ""]
+
+    if premios.empty or getnet.empty:
+        return {
+            "Conciliación": pd.DataFrame(),
+            "Resumen Conciliación": pd.DataFrame(columns=["Mes", "Premios", "Conciliados", "Sin Getnet", "Sin cliente"]),
+        }
+
+    if meses:
+        premios = premios[premios["Mes"].isin(meses)]
+    grupos = [(mes, grupo) for mes, grupo in premios.groupby("Mes", sort=True)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        partes = list(pool.map(lambda mg: _conciliar_mes(mg[0], mg[1], getnet, ventana), grupos))
+
+    detalle = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    if detalle.empty:
+        return {"Conciliación": detalle, "Resumen Conciliación": pd.DataFrame()}
+
+    resumen = (
+        detalle.assign(_ok=detalle["Estado"] == "Conciliado", _sin_cliente=detalle["Estado"] == "Sin cliente")
+          .groupby("Mes", as_index=False)
+          .agg(
+              Premios=("Estado", "size"),
+              Conciliados=("_ok", "sum"),
+              SinCliente=("_sin_cliente", "sum"),
+              MontoPremios=("MontoPremio", "sum"),
+              MontoGetnet=("MontoGetnet", "sum"),
+          )
+    )
+    resumen = resumen.rename(columns={"SinCliente": "Sin cliente"})
+    resumen["Sin Getnet"] = resumen["Premios"] - resumen["Conciliados"] - resumen["Sin cliente"]
+    resumen["% Conciliado"] = (100 * resumen["Conciliados"] / resumen["Premios"]).round(1)
+    resumen = resumen[["Mes", "Premios", "Conciliados", "Sin Getnet", "Sin cliente", "% Conciliado", "MontoPremios", "MontoGetnet"]]
+    resumen["Mes"] = resumen["Mes"].apply(_formatear_periodo)
+    detalle["Mes"] = detalle["Mes"].apply(_formatear_periodo)
+
+    return {"Conciliación": detalle, "Resumen Conciliación": resumen}
+
+def cargar_archivo(path: str, sheet_name: str | None = None) -> pd.DataFrame:
+    """DataFrame limpio de un upload: el Excel original o su copia compactada (.parquet, ver almacen)."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return _cargar_df(path, sheet_name=sheet_name)
+
 def procesar_sgos(path_xlsx: str, sheet_name: str | None = None, asistentes_filtro: list = None):
-    df = _cargar_df(path_xlsx, sheet_name=sheet_name)
+    df = cargar_archivo(path_xlsx, sheet_name=sheet_name)
     return generar_reportes(df, asistentes_filtro)
 
 def obtener_asistentes(path_xlsx: str, sheet_name: str | None = None) -> list:
     # print(f"DEBUG: obtener_asistentes called with path={path_xlsx}, sheet_name={sheet_name}")
-    df = _cargar_df(path_xlsx, sheet_name=sheet_name)
+    df = cargar_archivo(path_xlsx, sheet_name=sheet_name)
     return sorted(df["Attendant"].dropna().unique().tolist())
 
 def exportar_excel_bytes(tablas: dict) -> BytesIO:
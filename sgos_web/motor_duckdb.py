@@ -0,0 +1,226 @@
+"""
+Motor analítico opcional sobre DuckDB (embebido, en el mismo proceso).
+
+Con SGOS_MOTOR=duckdb los reportes históricos no convierten la tabla entera a
+pandas: los GROUP BY de generar_reportes leen directo (register, sin copia) el
+snapshot Arrow de operaciones / premios, que ya está mapeado en memoria (ver
+snapshot.py, se escribe al ingerir). Así ningún worker guarda una copia propia
+de la tabla. La categoría de pago se calcula en la misma consulta con un CASE
+armado una vez por versión (ver preparar_fuente).
+
+Cada worker usa a lo sumo SGOS_DUCKDB_HILOS hilos de DuckDB (por defecto, los
+núcleos repartidos entre los WEB_CONCURRENCY workers de gunicorn), para que
+varios workers no se peleen todos los núcleos.
+
+Cada consulta entrega la misma tabla que engine._agregados (mismas columnas,
+tipos y orden por claves) y las tablas finales las arma engine._armar_reportes,
+así que el resultado es idéntico al de pandas. Las sumas usan fsum (suma
+compensada, como groupby.sum); con montos enteros, como los de Getnet y
+Premios, son exactas en ambos motores.
+
+duckdb es opcional: si no está instalado, la app usa pandas.
+"""
+import os
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+try:
+    from sgos_web.engine import _armar_reportes, _clasificar_pago
+except ImportError:
+    from engine import _armar_reportes, _clasificar_pago
+
+# Lo único que leen las consultas; una selección parcial copia solo esto
+COLUMNAS_USADAS = ("fecha", "jornada", "monto", "attendant", "mes", "hora", "maquina", "categoria")
+
+# tabla: pyarrow.Table del snapshot; categoria: expresión SQL de la columna categoria
+Fuente = namedtuple("Fuente", ["tabla", "categoria"])
+
+_conexion = None
+_fuentes = {}  # nombre -> (versión, Fuente)
+_lock = threading.Lock()
+
+
+def disponible() -> bool:
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _conectar():
+    global _conexion
+    if _conexion is None:
+        import duckdb
+        _conexion = duckdb.connect(config={"threads": _hilos()})
+    return _conexion
+
+
+def _hilos() -> int:
+    if os.environ.get("SGOS_DUCKDB_HILOS"):
+        return max(1, int(os.environ["SGOS_DUCKDB_HILOS"]))
+    workers = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _cursor():
+    """Un cursor por consulta: comparten la base en memoria y cada hilo usa el suyo."""
+    with _lock:
+        return _conectar().cursor()
+
+
+def preparar_fuente(tabla, nombre: str, version: int) -> Fuente:
+    """
+    Fuente para consultar la pyarrow.Table `tabla` (versión `version` de
+    `nombre`). No copia datos: solo arma, la primera vez que este proceso ve la
+    versión, el CASE que clasifica forma_pago en `categoria`.
+    """
+    with _lock:
+        actual = _fuentes.get(nombre)
+        if actual is not None and actual[0] == version:
+            return actual[1]
+    categoria = "CAST(NULL AS VARCHAR)"
+    if "forma_pago" in tabla.column_names:
+        cur = _cursor()
+        try:
+            cur.register("origen", tabla)
+            categoria = _sql_categorias(cur)
+        finally:
+            cur.close()
+    fuente = Fuente(tabla, categoria)
+    with _lock:
+        _fuentes[nombre] = (version, fuente)
+    return fuente
+
+
+def _abrir(cur, fuente: Fuente) -> None:
+    """Deja en el cursor la vista `datos`: el snapshot más la columna categoria."""
+    cur.register("origen", fuente.tabla)
+    cur.execute(f"CREATE OR REPLACE TEMP VIEW datos AS SELECT *, {fuente.categoria} AS categoria FROM origen")
+
+
+def listar_asistentes(fuente: Fuente) -> list:
+    cur = _cursor()
+    try:
+        cur.register("origen", fuente.tabla)
+        filas = cur.execute("SELECT DISTINCT attendant FROM origen WHERE attendant IS NOT NULL").fetchall()
+    finally:
+        cur.close()
+    return sorted(a for (a,) in filas)
+
+
+def _df(cur, sql: str) -> pd.DataFrame:
+    return cur.execute(sql).df()
+
+
+def _literal(valor: str) -> str:
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def _sql_categorias(cur) -> str:
+    """
+    CASE forma_pago -> categoria para los valores distintos de `origen`, con la
+    misma normalización que engine (texto, minúsculas, sin espacios extremos).
+    """
+    formas = [f for (f,) in cur.execute("SELECT DISTINCT forma_pago FROM origen WHERE forma_pago IS NOT NULL").fetchall()]
+    pares = [(f, _clasificar_pago(str(f).lower().strip())) for f in formas]
+    casos = " ".join(f"WHEN {_literal(f)} THEN {_literal(c)}" for f, c in pares if c is not None)
+    return f"CASE forma_pago {casos} END" if casos else "CAST(NULL AS VARCHAR)"
+
+
+def _agregados(cur, con_categorias: bool, con_jornadas: bool) -> dict:
+    """Equivalente SQL de engine._agregados sobre la vista `filas`."""
+    def por(claves: dict, medidas: str):
+        columnas = ", ".join(f'{c} AS "{alias}"' for c, alias in claves.items())
+        no_nulos = " AND ".join(f"{c} IS NOT NULL" for c in claves)
+        orden = ", ".join(str(i + 1) for i in range(len(claves)))
+        return _df(cur, f"""
+            SELECT {columnas}, {medidas}
+            FROM filas
+            WHERE {no_nulos}
+            GROUP BY ALL
+            ORDER BY {orden}
+        """)
+
+    ops_monto = 'count(monto) AS "Operaciones", coalesce(fsum(monto), 0) AS "Monto"'
+    filas, min_fecha, max_fecha = cur.execute("SELECT count(*), min(fecha), max(fecha) FROM filas").fetchone()
+    horas = [h for (h,) in cur.execute("SELECT DISTINCT hora FROM filas WHERE hora IS NOT NULL ORDER BY hora").fetchall()]
+
+    ag = {
+        "mes": por({"mes": "Mes"}, ops_monto),
+        "hora": por({"hora": "Hora"}, ops_monto),
+        "asistente_mes": por({"attendant": "Attendant", "mes": "Mes"}, ops_monto),
+        "qa": {
+            "filas": filas,
+            "min_fecha": pd.Timestamp(min_fecha),
+            "max_fecha": pd.Timestamp(max_fecha),
+            "horas": horas,
+        },
+    }
+    if con_jornadas:
+        ag["jornadas"] = por(
+            {"attendant": "Attendant", "date_trunc('day', CAST(jornada AS TIMESTAMP))": "JornadaDia"},
+            'count(*) AS "TotalOperaciones"',
+        )
+
+    if con_categorias:
+        n = "count(monto) AS n"
+        monto_premios = """coalesce(fsum(CASE WHEN categoria = 'Premios' THEN monto ELSE 0 END), 0) AS "MontoPremios\""""
+
+        def largo(claves: dict):
+            return por({**claves, "categoria": "Categoria"}, n)
+
+        ag["categorias_mes_asistente"] = largo({"mes": "Mes", "attendant": "Attendant"})
+        ag["categorias_asistente"] = largo({"attendant": "Attendant"})
+        ag["categorias_mes_maquina"] = largo({"mes": "Mes", "maquina": "Maquina"})
+        ag["categorias_maquina"] = largo({"maquina": "Maquina"})
+        ag["monto_mes_maquina"] = por({"mes": "Mes", "maquina": "Maquina"}, monto_premios)
+        ag["monto_maquina"] = por({"maquina": "Maquina"}, monto_premios)
+    else:
+        ag["mes_asistente"] = por({"mes": "Mes", "attendant": "Attendant"}, 'count(monto) AS "Operaciones"')
+        ag["asistente"] = por({"attendant": "Attendant"}, 'count(monto) AS "Operaciones"')
+    return ag
+
+
+def generar_reportes(fuente: Fuente, tipo: str, asistentes_filtro: list = None, ops_record: pd.DataFrame = None) -> dict:
+    """
+    Mismas tablas que engine.generar_reportes(df, asistentes_filtro, ops_record)
+    con df = la tabla histórica de `tipo`, pero calculadas por DuckDB sobre
+    `fuente` (ver preparar_fuente; columnas de la BD).
+    """
+    cur = _cursor()
+    try:
+        return _generar(cur, fuente, tipo, asistentes_filtro, ops_record)
+    finally:
+        cur.close()  # Libera las tablas temporales de esta consulta
+
+
+def _generar(cur, fuente: Fuente, tipo: str, asistentes_filtro, ops_record) -> dict:
+    _abrir(cur, fuente)
+    if asistentes_filtro and not set(asistentes_filtro) >= set(listar_asistentes(fuente)):
+        # Selección parcial: se filtra una vez y las consultas leen solo esas filas
+        existentes = {d[0] for d in cur.execute("SELECT * FROM datos LIMIT 0").description}
+        columnas = ", ".join(c for c in COLUMNAS_USADAS if c in existentes)
+        cur.register("seleccion", pd.DataFrame({"attendant": list(asistentes_filtro)}, dtype=object))
+        cur.execute(f"""
+            CREATE OR REPLACE TEMP TABLE filas AS
+            SELECT {columnas} FROM datos WHERE attendant IN (SELECT attendant FROM seleccion)
+        """)
+    elif asistentes_filtro:
+        # Todos los asistentes (lo que pide el dashboard por defecto): isin() solo descarta los nulos
+        cur.execute("CREATE OR REPLACE TEMP VIEW filas AS SELECT * FROM datos WHERE attendant IS NOT NULL")
+    else:
+        cur.execute("CREATE OR REPLACE TEMP VIEW filas AS SELECT * FROM datos")
+    if asistentes_filtro and ops_record is not None:
+        ops_record = ops_record[ops_record["Attendant"].isin(asistentes_filtro)]
+
+    # Igual que engine: con la selección vacía no se reconoce como Premios
+    filas = cur.execute("SELECT count(*) FROM filas").fetchone()[0]
+    es_premios = tipo == "PREMIOS" and filas > 0
+
+    ag = _agregados(cur, con_categorias=es_premios, con_jornadas=ops_record is None)
+    if "jornadas" in ag:
+        ag["jornadas"]["JornadaDia"] = ag["jornadas"]["JornadaDia"].astype("datetime64[ns]")
+    return _armar_reportes(ag, es_premios, ops_record)
@@ -0,0 +1,118 @@
+"""
+Snapshot de solo lectura de las tablas históricas (operaciones / premios).
+
+Al ingerir un archivo se escribe la tabla completa como Arrow IPC y cada
+worker de gunicorn la abre con memory-map: los datos viven en el page cache
+del sistema y N workers comparten una sola copia en RAM.
+
+El archivo se nombra con la versión de datos de la tabla (guardada en la BD,
+ver VersionDatos); cuando la versión cambia, los workers mapean el archivo
+nuevo en su siguiente lectura.
+pyarrow es opcional: si no está instalado, la app lee directo de la BD.
+"""
+import os
+import threading
+
+SUBCARPETA = ".snapshots"
+
+_mapeados = {}  # tabla -> (version, pyarrow.Table)
+_lock = threading.Lock()
+
+
+def disponible() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def ruta_snapshot(directorio: str, tabla: str, version: int) -> str:
+    return os.path.join(directorio, f"{tabla}-v{version}.arrow")
+
+
+def _escribir_atomico(path: str, escribir, confirmar=None) -> bool:
+    """
+    Escribe en un temporal y lo renombra, para que un lector nunca vea un
+    archivo a medias. Si confirmar() devuelve False, el temporal se descarta.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        escribir(tmp)
+        if confirmar is not None and not confirmar():
+            return False
+        os.replace(tmp, path)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def existe(directorio: str, tabla: str, version: int) -> bool:
+    return os.path.exists(ruta_snapshot(directorio, tabla, version))
+
+
+def escribir_snapshot(directorio: str, tabla: str, version: int, schema, bloques, vigente=None) -> bool:
+    """
+    Guarda como snapshot de `tabla` para la versión de datos `version` los
+    pyarrow.RecordBatch de `bloques` (con `schema`), cada uno apenas llega:
+    la tabla completa nunca está en memoria. Con `vigente`, el archivo solo
+    se publica si vigente() sigue siendo cierto al terminar (devuelve si se
+    publicó). Las versiones menores se borran (en Linux los workers que aún
+    las tengan mapeadas siguen leyendo sin problema hasta remapear).
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    os.makedirs(directorio, exist_ok=True)
+
+    def _escribir_arrow(tmp):
+        with pa.OSFile(tmp, "wb") as sink, ipc.new_file(sink, schema) as writer:
+            for bloque in bloques:
+                writer.write_batch(bloque)
+
+    if not _escribir_atomico(ruta_snapshot(directorio, tabla, version), _escribir_arrow, vigente):
+        return False
+
+    for nombre in os.listdir(directorio):
+        if not (nombre.startswith(f"{tabla}-v") and nombre.endswith(".arrow")):
+            continue
+        try:
+            vieja = int(nombre[len(tabla) + 2:-len(".arrow")])
+        except ValueError:
+            continue
+        if vieja < version:
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except OSError:
+                pass  # Windows no deja borrar un archivo mapeado; se limpia en la próxima escritura
+    return True
+
+
+def leer_snapshot(directorio: str, tabla: str, version: int):
+    """
+    Devuelve la pyarrow.Table mapeada para `version`, o None si ese snapshot
+    no existe (o pyarrow no está instalado).
+    """
+    if not disponible():
+        return None
+
+    cacheado = _mapeados.get(tabla)
+    if cacheado and cacheado[0] == version:
+        return cacheado[1]
+
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    with _lock:
+        cacheado = _mapeados.get(tabla)
+        if cacheado and cacheado[0] == version:
+            return cacheado[1]
+        try:
+            source = pa.memory_map(ruta_snapshot(directorio, tabla, version), "r")
+        except FileNotFoundError:
+            return None
+        # read_all() sobre un memory_map no copia: los buffers apuntan al archivo
+        table = ipc.open_file(source).read_all()
+        _mapeados[tabla] = (version, table)
+        return table
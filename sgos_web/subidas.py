@@ -0,0 +1,243 @@
+"""
+Subidas por partes (reanudables) de archivos grandes.
+
+El navegador pide un id con crear(), manda el archivo en bloques indicando el
+offset de cada uno y al final pide completar. Cada bloque se agrega directo a
+uploads/<id>.part, así que en memoria nunca hay más de un bloque. El estado
+(nombre, tamaño, sha256 esperado, etapa de la ingesta) vive en
+uploads/<id>.subida como JSON, para que cualquier worker pueda atender el
+siguiente bloque o responder el estado.
+
+Cada bloque puede traer su propio sha256 (el navegador lo calcula con
+SubtleCrypto); si no coincide con lo que llegó, el bloque se descarta y el
+cliente lo reenvía. El sha256 del archivo completo se calcula a medida que
+llegan los bloques mientras el mismo proceso los atienda; si uno lo atiende
+otro worker, se deja de llevar y ensamblar() lo calcula de una pasada al
+final. Un cliente que lo conozca de antemano (p.ej. un script) puede mandarlo
+en crear() y ensamblar() lo verifica.
+
+Mientras se ingiere, el worker renueva un latido en el estado (ver latiendo).
+Si el worker muere a medio proceso, el latido vence y leer() informa error en
+vez de dejar la subida "procesando" para siempre.
+
+Los dos archivos usan extensiones que el barrido de uploads trata como "en
+curso" (ver almacen.py): no se compactan ni cuentan para la cuota, y se borran
+solo si quedan abandonados.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SUFIJO_DATOS = ".part"
+SUFIJO_ESTADO = ".subida"
+BLOQUE_LECTURA = 1024 * 1024  # 1MB
+LATIDO_SEGUNDOS = 15
+LATIDO_VENCIDO = 120  # Sin latido por más que esto, la ingesta se da por muerta
+
+_hashes = {}  # id -> (bytes procesados, hashlib.sha256)
+_locks = {}  # id -> Lock: un bloque a la vez por subida, sin frenar a las demás
+_lock = threading.Lock()
+
+
+class SubidaInvalida(ValueError):
+    """Error del cliente: offset fuera de lugar, tamaño o checksum que no cuadra."""
+
+
+def _ruta(carpeta: str, id_subida: str, sufijo: str) -> str:
+    # El id es siempre un uuid hex: nada de rutas ni puntos
+    if not re.fullmatch(r"[0-9a-f]{32}", id_subida or ""):
+        raise SubidaInvalida("Id de subida inválido.")
+    return os.path.join(carpeta, id_subida + sufijo)
+
+
+def _guardar_estado(carpeta: str, estado: dict) -> None:
+    path = _ruta(carpeta, estado["id"], SUFIJO_ESTADO)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+    os.replace(tmp, path)
+
+
+def crear(carpeta: str, nombre: str, tamano: int, sha256: str | None = None) -> dict:
+    estado = {
+        "id": uuid.uuid4().hex,
+        "nombre": nombre,
+        "tamano": int(tamano),
+        "sha256": (sha256 or "").lower() or None,
+        "etapa": "subiendo",  # subiendo -> procesando -> listo | error
+        "archivo": None,
+        "mensaje": None,
+        "creado": time.time(),
+    }
+    open(_ruta(carpeta, estado["id"], SUFIJO_DATOS), "wb").close()
+    _guardar_estado(carpeta, estado)
+    return estado
+
+
+def _leer_estado(carpeta: str, id_subida: str) -> dict | None:
+    try:
+        with open(_ruta(carpeta, id_subida, SUFIJO_ESTADO), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def leer(carpeta: str, id_subida: str) -> dict | None:
+    """
+    Estado de la subida más los bytes ya recibidos, o None si no existe. Una
+    ingesta sin latido reciente se informa como error.
+    """
+    estado = _leer_estado(carpeta, id_subida)
+    if estado is None:
+        return None
+    try:
+        estado["recibido"] = os.path.getsize(_ruta(carpeta, id_subida, SUFIJO_DATOS))
+    except FileNotFoundError:
+        estado["recibido"] = estado["tamano"] if estado["etapa"] != "subiendo" else 0
+    if estado["etapa"] == "procesando" and time.time() - estado.get("latido", estado["creado"]) > LATIDO_VENCIDO:
+        estado["etapa"] = "error"
+        estado["mensaje"] = "El procesamiento se interrumpió (se reinició el servidor). Vuelve a subir el archivo."
+    return estado
+
+
+def actualizar(carpeta: str, id_subida: str, **cambios) -> None:
+    estado = _leer_estado(carpeta, id_subida)
+    if estado is None:
+        return
+    estado.update(cambios)
+    _guardar_estado(carpeta, estado)
+
+
+@contextmanager
+def latiendo(carpeta: str, id_subida: str):
+    """
+    Renueva el latido de la subida cada LATIDO_SEGUNDOS mientras dura el
+    bloque with. Al salir, el hilo del latido ya terminó: lo que se escriba
+    después (etapa listo / error) no se pisa.
+    """
+    fin = threading.Event()
+
+    def _latir():
+        while not fin.wait(LATIDO_SEGUNDOS):
+            actualizar(carpeta, id_subida, latido=time.time())
+
+    hilo = threading.Thread(target=_latir, name=f"latido-{id_subida}", daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        fin.set()
+        hilo.join()
+
+
+def _lock_de(id_subida: str) -> threading.Lock:
+    with _lock:
+        return _locks.setdefault(id_subida, threading.Lock())
+
+
+def _hash_hasta(path: str, id_subida: str, offset: int):
+    """sha256 de los primeros `offset` bytes, reutilizando el del proceso si está al día."""
+    previo = _hashes.pop(id_subida, None)
+    if previo is not None and previo[0] == offset:
+        return previo[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        restante = offset
+        while restante:
+            bloque = f.read(min(BLOQUE_LECTURA, restante))
+            if not bloque:
+                break
+            h.update(bloque)
+            restante -= len(bloque)
+    return h
+
+
+def escribir_bloque(carpeta: str, id_subida: str, offset: int, stream, sha256_bloque: str | None = None) -> int:
+    """
+    Agrega el bloque que llega por `stream` en `offset` y devuelve los bytes
+    recibidos en total. El offset tiene que ser exactamente lo ya recibido:
+    así un reintento de un bloque que sí llegó se rechaza en vez de duplicarse,
+    y el cliente retoma desde lo que informa leer(). Con `sha256_bloque`, un
+    bloque que no coincide se descarta.
+    """
+    path = _ruta(carpeta, id_subida, SUFIJO_DATOS)
+    with _lock_de(id_subida):
+        estado = leer(carpeta, id_subida)
+        if estado is None:
+            raise SubidaInvalida("La subida no existe.")
+        if estado["etapa"] != "subiendo":
+            raise SubidaInvalida("La subida ya se completó.")
+        if offset != estado["recibido"]:
+            raise SubidaInvalida(f"Offset {offset} no coincide con lo recibido ({estado['recibido']}).")
+
+        # El hash del archivo solo se sigue si este proceso lo tiene al día;
+        # si no, releer todo lo recibido en cada bloque sería O(n²): queda para ensamblar()
+        previo = _hashes.pop(id_subida, None)
+        if offset == 0:
+            h = hashlib.sha256()
+        else:
+            h = previo[1] if previo is not None and previo[0] == offset else None
+        h_bloque = hashlib.sha256()
+        total = offset
+        with open(path, "r+b") as out:
+            out.seek(offset)
+            # Bloque cortado a medias: lo escrito queda en disco y el cliente retoma desde ahí
+            for bloque in iter(lambda: stream.read(BLOQUE_LECTURA), b""):
+                total += len(bloque)
+                if total > estado["tamano"]:
+                    out.truncate(offset)
+                    raise SubidaInvalida("El archivo supera el tamaño declarado.")
+                h_bloque.update(bloque)
+                if h is not None:
+                    h.update(bloque)
+                out.write(bloque)
+            if sha256_bloque and h_bloque.hexdigest() != sha256_bloque.lower():
+                out.truncate(offset)
+                raise SubidaInvalida("El bloque llegó dañado; reenvíalo.")
+            out.truncate(total)
+        if h is not None:
+            _hashes[id_subida] = (total, h)
+    return total
+
+
+def ensamblar(carpeta: str, id_subida: str, destino: str) -> str:
+    """
+    Verifica tamaño y checksum y mueve el archivo armado a `destino`.
+    Devuelve su sha256.
+    """
+    path = _ruta(carpeta, id_subida, SUFIJO_DATOS)
+    with _lock_de(id_subida):
+        estado = leer(carpeta, id_subida)
+        if estado is None or estado["etapa"] != "subiendo":
+            raise SubidaInvalida("La subida no existe o ya se completó.")
+        if estado["recibido"] != estado["tamano"]:
+            raise SubidaInvalida(f"Faltan datos: recibidos {estado['recibido']} de {estado['tamano']} bytes.")
+        sha256 = _hash_hasta(path, id_subida, estado["tamano"]).hexdigest()
+        if estado["sha256"] and estado["sha256"] != sha256:
+            raise SubidaInvalida("El checksum del archivo no coincide; vuelve a subirlo.")
+
+        os.replace(path, destino)
+        actualizar(carpeta, id_subida, etapa="procesando", latido=time.time())
+    olvidar(id_subida)
+    return sha256
+
+
+def olvidar(id_subida: str) -> None:
+    """Libera lo que el proceso guarda en memoria para la subida."""
+    with _lock:
+        _hashes.pop(id_subida, None)
+        _locks.pop(id_subida, None)
+
+
+def descartar(carpeta: str, id_subida: str) -> None:
+    olvidar(id_subida)
+    for sufijo in (SUFIJO_DATOS, SUFIJO_ESTADO):
+        try:
+            os.remove(_ruta(carpeta, id_subida, sufijo))
+        except FileNotFoundError:
+            pass